@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clist', '0068_auto_20210703_2308'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timingcontest',
+            name='standings_fingerprint',
+            field=models.CharField(blank=True, default=None, max_length=32, null=True),
+        ),
+    ]
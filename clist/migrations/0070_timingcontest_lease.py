@@ -0,0 +1,23 @@
+# Generated by Django 3.1.12 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clist', '0069_timingcontest_standings_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timingcontest',
+            name='lease_owner',
+            field=models.CharField(blank=True, default=None, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='timingcontest',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clist', '0070_timingcontest_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timingcontest',
+            name='statistic_backoff',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -391,8 +391,11 @@ class Problem(BaseModel):
             GistIndexTrgrmOps(fields=['name']),
         ]
 
-    def save(self, *args, **kwargs):
+    def update_visible(self):
         self.visible = bool(self.url) or self.key != self.name
+
+    def save(self, *args, **kwargs):
+        self.update_visible()
         super().save(*args, **kwargs)
 
 
@@ -405,10 +408,69 @@ class TimingContest(BaseModel):
     contest = models.OneToOneField(Contest, related_name='timing', on_delete=models.CASCADE)
     notification = models.DateTimeField(auto_now_add=True, blank=True)
     statistic = models.DateTimeField(default=None, null=True, blank=True)
+    standings_fingerprint = models.CharField(max_length=32, default=None, null=True, blank=True)
+    lease_owner = models.CharField(max_length=255, default=None, null=True, blank=True)
+    lease_expires = models.DateTimeField(default=None, null=True, blank=True)
+    statistic_backoff = models.PositiveSmallIntegerField(default=0)
+
+    LEASE_DURATION = timedelta(minutes=10)
 
     def __str__(self):
         return '%s timing, modified = %s' % (str(self.contest), self.modified)
 
+    @staticmethod
+    def free_lease_filter(now, prefix=''):
+        return Q(**{f'{prefix}lease_expires__isnull': True}) | Q(**{f'{prefix}lease_expires__lt': now})
+
+    @classmethod
+    def acquire_leases(cls, contests_statistics, owner, now=None, duration=None):
+        """
+        Lease timings by contests ids with SELECT ... FOR UPDATE SKIP LOCKED, timings leased by others
+        or with statistic time changed since caller has seen it are skipped.
+        Must be called in transaction, returned timings are saved by caller in the same transaction.
+        """
+        now = now or timezone.now()
+        expires = now + (duration or cls.LEASE_DURATION)
+        qs = cls.objects.select_for_update(skip_locked=True).filter(contest_id__in=contests_statistics.keys())
+        qs = qs.filter(cls.free_lease_filter(now) | Q(lease_owner=owner))
+        timings = [t for t in qs if t.statistic == contests_statistics[t.contest_id]]
+        for timing in timings:
+            timing.lease_owner = owner
+            timing.lease_expires = expires
+            timing.modified = now
+        return timings
+
+    @classmethod
+    def renew_leases(cls, timings, owner, duration=None):
+        expires = timezone.now() + (duration or cls.LEASE_DURATION)
+        cls.objects.filter(pk__in=[t.pk for t in timings], lease_owner=owner).update(lease_expires=expires)
+        for timing in timings:
+            if timing.lease_owner == owner:
+                timing.lease_expires = expires
+
+    @classmethod
+    def release_leases(cls, contests_ids, owner):
+        cls.objects.filter(contest_id__in=contests_ids, lease_owner=owner).update(lease_owner=None, lease_expires=None)
+
+    def update_statistic_backoff(self, changed, min_delay, max_delay):
+        """
+        Exponentially postpone statistic time while parsed standings are unchanged, reset on change.
+        """
+        if changed:
+            self.statistic_backoff = 0
+            return
+        delay = min(min_delay * 2 ** self.statistic_backoff, max_delay)
+        if delay < max_delay:
+            self.statistic_backoff += 1
+        statistic = timezone.now() + delay
+        if self.statistic is None or self.statistic < statistic:
+            self.statistic = statistic
+
+    def release_lease(self, owner):
+        TimingContest.objects.filter(pk=self.pk, lease_owner=owner).update(lease_owner=None, lease_expires=None)
+        self.lease_owner = None
+        self.lease_expires = None
+
 
 class Banner(BaseModel):
     name = models.CharField(max_length=255)
@@ -1,4 +1,3 @@
-import re
 from datetime import timedelta
 from urllib.parse import parse_qs, urlparse
 
@@ -9,14 +8,14 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.core.management.commands import dumpdata
 from django.db.models import Avg, Count, F, FloatField, IntegerField, Max, Min, Q
-from django.db.models.functions import Cast, Ln
+from django.db.models.functions import Cast, Ln, Upper
 from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from el_pagination.decorators import page_template, page_templates
-from sql_util.utils import Exists
+from sql_util.utils import Exists, SubqueryCount
 
 from clist.models import Banner, Contest, Problem, ProblemTag, Resource
 from clist.templatetags.extras import (canonize, get_problem_key, get_problem_name, get_problem_short,
@@ -512,29 +511,32 @@ def update_writers(contest, writers=None):
         contest.info['writers'] = writers
         contest.save()
 
-    def get_re_writers(writers):
-        ret = '|'.join([re.escape(w) for w in writers])
-        ret = f'^({ret})$'
-        return ret
-
-    writers = contest.info.get('writers', [])
-    if not writers:
-        contest.writers.clear()
-        return
-
-    re_writers = get_re_writers(writers)
-    for writer in contest.writers.filter(~Q(key__iregex=re_writers)):
-        contest.writers.remove(writer)
-    already_writers = set(contest.writers.filter(key__iregex=re_writers).values_list('key', flat=True))
-    re_already_writers = re.compile(get_re_writers(already_writers))
-    for writer in writers:
-        if re_already_writers.match(writer):
-            continue
-
-        account = Account.objects.filter(resource=contest.resource, key__iexact=writer).order_by('-n_contests').first()
-        if account is None:
-            account, created = Account.objects.get_or_create(resource=contest.resource, key=writer)
-        account.writer_set.add(contest)
+    writers = {writer.upper(): writer for writer in contest.info.get('writers', [])}
+
+    ContestWriters = Contest.writers.through
+    old_writers = ContestWriters.objects.filter(contest=contest).annotate(upper_key=Upper('account__key'))
+    old_writers = dict(old_writers.values_list('account_id', 'upper_key'))
+    removed = [pk for pk, upper_key in old_writers.items() if upper_key not in writers]
+    old_upper_keys = set(old_writers.values())
+    missing = [writer for upper_key, writer in writers.items() if upper_key not in old_upper_keys]
+
+    accounts = Account.objects.get_by_iexact_keys(contest.resource, missing)
+    not_found = [writer for writer in missing if writer not in accounts]
+    if not_found:
+        not_found_accounts, _ = Account.objects.bulk_get_or_create(contest.resource, not_found)
+        accounts.update(not_found_accounts)
+    added = {accounts[writer].pk for writer in missing} - set(old_writers)
+
+    if removed:
+        ContestWriters.objects.filter(contest=contest, account_id__in=removed).delete()
+    if added:
+        ContestWriters.objects.bulk_create(
+            [ContestWriters(contest=contest, account_id=pk) for pk in added],
+            ignore_conflicts=True,
+        )
+    if removed or added:
+        accounts = Account.objects.filter(pk__in=set(removed) | added)
+        accounts.annotate(count=SubqueryCount('writer_set')).update(n_writers=F('count'))
 
 
 def update_problems(contest, problems=None, force=False):
@@ -552,8 +554,8 @@ def update_problems(contest, problems=None, force=False):
     else:
         problem_sets = [(None, problems)]
 
-    old_problem_ids = set(contest.problem_set.values_list('id', flat=True))
     added_problems = dict()
+    problems_tags = dict()
     for division, problem_set in problem_sets:
         last_group = None
         for index, problem_info in enumerate(problem_set, start=1):
@@ -568,45 +570,87 @@ def update_problems(contest, problems=None, force=False):
 
             added_problem = added_problems.get(key)
 
-            defaults = {
+            added_problems[key] = {
                 'index': index if not added_problem else None,
                 'short': short,
                 'name': name,
-                'divisions': getattr(added_problem, 'divisions', []) + [division] if division else None,
+                'divisions': (added_problem or {}).get('divisions', []) + [division] if division else None,
                 'url': problem_info.get('url'),
-                'n_tries': problem_info.get('n_teams', 0) + getattr(added_problem, 'n_tries', 0),
-                'n_accepted': problem_info.get('n_accepted', 0) + getattr(added_problem, 'n_accepted', 0),
+                'n_tries': problem_info.get('n_teams', 0) + (added_problem or {}).get('n_tries', 0),
+                'n_accepted': problem_info.get('n_accepted', 0) + (added_problem or {}).get('n_accepted', 0),
                 'time': contest.start_time,
             }
 
-            problem, created = Problem.objects.update_or_create(
-                contest=contest,
-                resource=contest.resource,
-                key=key,
-                defaults=defaults,
-            )
-
-            old_tags = set(problem.tags.all())
-            if 'tags' in problem_info:
-                if '' in problem_info['tags']:
-                    problem_info['tags'].remove('')
-                    contest.save()
-
-                for name in problem_info['tags']:
-                    tag, _ = ProblemTag.objects.get_or_create(name=name)
-                    if tag in old_tags:
-                        old_tags.discard(tag)
-                    else:
-                        problem.tags.add(tag)
-            for tag in old_tags:
-                problem.tags.remove(tag)
-
-            added_problems[key] = problem
-
-            if problem.id in old_problem_ids:
-                old_problem_ids.remove(problem.id)
-    if old_problem_ids:
-        Problem.objects.filter(id__in=old_problem_ids).delete()
+            if 'tags' in problem_info and '' in problem_info['tags']:
+                problem_info['tags'].remove('')
+                contest.save()
+            problems_tags[key] = set(problem_info.get('tags', []))
+
+    now = timezone.now()
+    old_problems = {problem.key: problem for problem in Problem.objects.filter(contest=contest)}
+    created_problems = []
+    updated_problems = []
+    update_fields = set()
+    for key, defaults in added_problems.items():
+        problem = old_problems.pop(key, None)
+        if problem is None:
+            problem = Problem(contest=contest, resource=contest.resource, key=key, **defaults)
+            problem.update_visible()
+            created_problems.append(problem)
+            continue
+        changed = [field for field, value in defaults.items() if getattr(problem, field) != value]
+        for field in changed:
+            setattr(problem, field, defaults[field])
+        if problem.resource_id != contest.resource_id:
+            problem.resource = contest.resource
+            changed.append('resource')
+        visible = problem.visible
+        problem.update_visible()
+        if visible != problem.visible:
+            changed.append('visible')
+        if changed:
+            problem.modified = now
+            update_fields.update(changed)
+            updated_problems.append(problem)
+
+    if created_problems:
+        Problem.objects.bulk_create(created_problems)
+    if updated_problems:
+        Problem.objects.bulk_update(updated_problems, fields=list(update_fields) + ['modified'])
+    if old_problems:
+        Problem.objects.filter(id__in=[problem.id for problem in old_problems.values()]).delete()
+
+    tags_names = set.union(set(), *problems_tags.values())
+    tags = dict(ProblemTag.objects.filter(name__in=tags_names).values_list('name', 'id'))
+    if len(tags) != len(tags_names):
+        ProblemTag.objects.bulk_create([ProblemTag(name=name) for name in tags_names if name not in tags],
+                                       ignore_conflicts=True)
+        tags = dict(ProblemTag.objects.filter(name__in=tags_names).values_list('name', 'id'))
+
+    problems_ids = dict(Problem.objects.filter(contest=contest).values_list('key', 'id'))
+    problems_tags = {
+        (problems_ids[key], tags[name])
+        for key, names in problems_tags.items()
+        for name in names
+    }
+
+    ProblemTagProblems = ProblemTag.problems.through
+    old_problems_tags = {
+        (problem_id, tag_id): pk
+        for pk, problem_id, tag_id in ProblemTagProblems.objects.filter(
+            problem__contest=contest,
+        ).values_list('pk', 'problem_id', 'problemtag_id')
+    }
+    delete_ids = [pk for problem_tag, pk in old_problems_tags.items() if problem_tag not in problems_tags]
+    if delete_ids:
+        ProblemTagProblems.objects.filter(pk__in=delete_ids).delete()
+    create_problems_tags = [
+        ProblemTagProblems(problem_id=problem_id, problemtag_id=tag_id)
+        for problem_id, tag_id in problems_tags
+        if (problem_id, tag_id) not in old_problems_tags
+    ]
+    if create_problems_tags:
+        ProblemTagProblems.objects.bulk_create(create_problems_tags, ignore_conflicts=True)
 
 
 @page_template('problems_paging.html')
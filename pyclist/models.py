@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models
 
 
 class BaseModel(models.Model):
@@ -11,5 +11,47 @@ class BaseModel(models.Model):
 
 class BaseManager(models.Manager):
 
+    def bulk_upsert(self, objs, unique_fields, update_fields, returning=('id', ), batch_size=1000):
+        """
+        INSERT ... ON CONFLICT (unique_fields) DO UPDATE SET update_fields for objs by chunks.
+        With update_fields is None conflicting rows are skipped (DO NOTHING) and not returned.
+        Signals are not sent. Return list of tuples with returning values and flag that row was inserted.
+        """
+        if not objs:
+            return []
+        meta = self.model._meta
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+
+        fields = [f for f in meta.concrete_fields if not f.primary_key]
+        columns = ', '.join(qn(f.column) for f in fields)
+        conflict = ', '.join(qn(meta.get_field(f).column) for f in unique_fields)
+        if update_fields is None:
+            action = 'NOTHING'
+        else:
+            update_fields = [meta.get_field(f) for f in update_fields]
+            update_fields.extend(f for f in fields if getattr(f, 'auto_now', False) and f not in update_fields)
+            action = 'UPDATE SET ' + ', '.join(f'{qn(f.column)} = EXCLUDED.{qn(f.column)}' for f in update_fields)
+        returning = ', '.join(qn(meta.get_field(f).column) for f in returning)
+        placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+        ret = []
+        with connection.cursor() as cursor:
+            for offset in range(0, len(objs), batch_size):
+                chunk = objs[offset:offset + batch_size]
+                params = []
+                for obj in chunk:
+                    for f in fields:
+                        params.append(f.get_db_prep_save(f.pre_save(obj, add=True), connection=connection))
+                values = ', '.join([placeholder] * len(chunk))
+                cursor.execute(
+                    f'INSERT INTO {qn(meta.db_table)} ({columns}) VALUES {values} '
+                    f'ON CONFLICT ({conflict}) DO {action} '
+                    f'RETURNING {returning}, (xmax = 0)',
+                    params,
+                )
+                ret.extend(cursor.fetchall())
+        return ret
+
     class Meta:
         abstract = True
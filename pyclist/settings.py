@@ -246,6 +246,9 @@ LOGGING = {
             'format': str(cs('[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s', 'grey')),
             'datefmt': '%Y-%m-%d %H:%M:%S',
         },
+        'message': {
+            'format': '%(message)s',
+        },
     },
     'handlers': {
         'null': {
@@ -296,6 +299,15 @@ LOGGING = {
             'filename': path.join(BASE_DIR, 'logs', 'telegram.log'),
             'formatter': 'verbose',
         },
+        'parse_statistic_profile': {
+            'level': 'INFO',
+            'class': 'logging.handlers.TimedRotatingFileHandler',
+            'when': 'midnight',
+            'interval': 1,
+            'backupCount': 30,
+            'filename': path.join(BASE_DIR, 'logs', 'parse_statistic_profile.log'),
+            'formatter': 'message',
+        },
     },
     'loggers': {
         'django.security.DisallowedHost': {
@@ -314,6 +326,11 @@ LOGGING = {
             'handlers': ['telegrambot'],
             'level': 'DEBUG',
         },
+        'ranking.parse.statistic.profile': {
+            'handlers': ['parse_statistic_profile'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'django.db.backends': {
             'handlers': ['db'],
             'level': 'DEBUG',
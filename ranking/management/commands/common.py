@@ -1,10 +1,14 @@
 import functools
 import json
+import multiprocessing
 import operator
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import tqdm
+from django.db import connections
 from django.db.models import Q
 from django.utils import timezone
+from traceback_with_variables import format_exc
 
 from ranking.models import Statistics
 
@@ -19,6 +23,7 @@ def account_update_contest_additions(
     timedelta_limit=None,
     by=None,
     clear_rating_change=None,
+    batch_size=1000,
 ):
     contest_keys = set(contest_addition_update.keys())
 
@@ -28,23 +33,29 @@ def account_update_contest_additions(
 
     qs = Statistics.objects.filter(account=account)
     if timedelta_limit is not None and not clear_rating_change:
-        qs.filter(modified__lte=timezone.now() - timedelta_limit)
+        qs = qs.filter(modified__lte=timezone.now() - timedelta_limit)
 
+    now = timezone.now()
     if clear_rating_change:
         qs_clear = qs.filter(Q(addition__rating_change__isnull=False) | Q(addition__new_rating__isnull=False))
+        stats = []
         for s in tqdm.tqdm(qs_clear.iterator(), desc='clear rating change'):
             s.addition.pop('rating_change', None)
             s.addition.pop('new_rating', None)
             s.addition.pop('old_rating', None)
-            s.save()
+            s.modified = now
+            s.fingerprint = None
+            stats.append(s)
+        Statistics.objects.bulk_update(stats, ['addition', 'modified', 'fingerprint'], batch_size=batch_size)
 
     conditions = (Q(**{f'contest__{field}__in': contest_keys}) for field in fields)
     condition = functools.reduce(operator.__or__, conditions)
     qs = qs.filter(condition).select_related('contest')
 
-    total = 0
+    stats = []
+    contests = {}
+    updated_contests = set()
     for stat in tqdm.tqdm(qs.iterator(), desc=f'updating additions for {account.key}', position=1):
-        total += 1
         addition = dict(stat.addition)
         for field in fields:
             key = getattr(stat.contest, field)
@@ -58,12 +69,47 @@ def account_update_contest_additions(
         if to_canonize_str(stat.addition) == to_canonize_str(addition):
             continue
         stat.addition = addition
-        stat.save()
+        stat.modified = now
+        stat.fingerprint = None
+        stats.append(stat)
 
-        to_save = False
+        contest = contests.setdefault(stat.contest_id, stat.contest)
+        contest_fields = contest.info.setdefault('fields', [])
         for k in ordered_dict.keys():
-            if k not in stat.contest.info['fields']:
-                stat.contest.info['fields'].append(k)
-                to_save = True
-        if to_save:
-            stat.contest.save()
+            if k not in contest_fields:
+                contest_fields.append(k)
+                updated_contests.add(contest.pk)
+
+    Statistics.objects.bulk_update(stats, ['addition', 'modified', 'fingerprint'], batch_size=batch_size)
+    for contest_id in updated_contests:
+        contests[contest_id].save()
+
+
+def add_workers_argument(parser):
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Parallel workers partitioned by resource')
+
+
+def create_workers_executor(workers):
+    # every worker process gets own db connection and requester
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+
+def run_by_workers(worker, groups, kwargs, workers, logger):
+    """
+    Call worker(group, kwargs) for every group in forked processes, return sum of returned counts and totals.
+    Groups are partitioned by resource, so one resource is parsed only by one worker.
+    """
+    count = 0
+    total = 0
+    with create_workers_executor(workers) as executor:
+        futures = [executor.submit(worker, group, kwargs) for group in groups]
+        for future in as_completed(futures):
+            try:
+                c, t = future.result()
+            except Exception:
+                logger.error(format_exc())
+                continue
+            count += c
+            total += t
+    return count, total
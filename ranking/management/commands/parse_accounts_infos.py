@@ -3,6 +3,7 @@
 
 import os
 import sys
+from collections import defaultdict
 from datetime import timedelta
 from logging import getLogger
 
@@ -16,12 +17,18 @@ from tqdm import tqdm
 from traceback_with_variables import format_exc
 
 from clist.models import Resource
-from ranking.management.commands.common import account_update_contest_additions
+from ranking.management.commands.common import (account_update_contest_additions, add_workers_argument,
+                                                run_by_workers)
 from ranking.management.commands.countrier import Countrier
-from ranking.models import Account
+from ranking.models import Account, deferred_counters
 from true_coders.models import Coder
 
 
+def parse_accounts_infos_worker(resource_id, kwargs):
+    resource = Resource.objects.get(pk=resource_id)
+    return Command().parse_resource_accounts_infos(resource, **kwargs)
+
+
 class Command(BaseCommand):
     help = 'Parsing accounts infos'
 
@@ -35,12 +42,154 @@ class Command(BaseCommand):
         parser.add_argument('-f', '--force', action='store_true', help='get accounts with min updated time')
         parser.add_argument('-l', '--limit', default=None, type=int,
                             help='limit users for one resource (default is 1000)')
+        add_workers_argument(parser)
+        parser.add_argument('--batch-size', type=int, default=100, help='accounts in one bulk write')
 
     @staticmethod
     def _get_plugin(module):
         sys.path.append(os.path.dirname(module.path))
         return __import__(module.path.replace('/', '.'), fromlist=['Statistic'])
 
+    def link_coders(self, resource, accounts_coders):
+        keys = set()
+        for coders in accounts_coders.values():
+            keys.update(coders)
+        coders_by_key = defaultdict(set)
+        qs = Coder.objects.filter(account__resource=resource, account__key__in=keys)
+        for coder_id, key in qs.values_list('pk', 'account__key'):
+            coders_by_key[key].add(coder_id)
+
+        accounts = {account.pk: account for account in accounts_coders}
+        existing = defaultdict(set)
+        qs = Account.coders.through.objects.filter(account_id__in=accounts)
+        for account_id, coder_id in qs.values_list('account_id', 'coder_id'):
+            existing[account_id].add(coder_id)
+
+        for account, coders in accounts_coders.items():
+            coders_ids = set()
+            for key in coders:
+                coders_ids |= coders_by_key.get(key, set())
+            coders_ids -= existing[account.pk]
+            if coders_ids:
+                account.coders.add(*coders_ids)
+
+    def flush_accounts(self, resource, accounts, accounts_coders, batch_size):
+        with transaction.atomic():
+            Account.objects.bulk_save(accounts, fields=['country', 'name', 'info', 'updated'], batch_size=batch_size)
+            if accounts_coders:
+                self.link_coders(resource, accounts_coders)
+        saved = {account.pk for account in accounts}
+        accounts.clear()
+        accounts_coders.clear()
+        return saved
+
+    def parse_resource_accounts_infos(self, resource, now, query=None, force=False, limit=None, has_param=False,
+                                      batch_size=100):
+        accounts = resource.account_set
+
+        if query:
+            accounts = accounts.filter(Q(key__iregex=query) | Q(name__iregex=query))
+        elif force:
+            accounts = accounts.order_by('updated')
+        else:
+            accounts = accounts.filter(Q(updated__isnull=True) | Q(updated__lte=now))
+
+        count, total = 0, accounts.count()
+        resource_info = resource.info.get('accounts', {})
+        if limit or not resource_info.get('nolimit', False) or resource_info.get('limit'):
+            limit = resource_info.get('limit') or limit or 1000
+            accounts = accounts[:limit]
+        accounts = list(accounts)
+
+        if not accounts:
+            return count, total
+
+        countrier = Countrier()
+        saved = set()
+        to_save = []
+        accounts_coders = {}
+        try:
+            with tqdm(total=len(accounts), desc=f'getting {resource.host} (total = {total})') as pbar, \
+                    deferred_counters:
+                resource.plugin.Statistic.configure_rate_limits(resource)
+                infos = resource.plugin.Statistic.get_users_infos(
+                    users=[a.key for a in accounts],
+                    resource=resource,
+                    accounts=accounts,
+                    pbar=pbar,
+                )
+
+                for account, data in zip(accounts, infos):
+                    if data.get('skip'):
+                        continue
+                    count += 1
+                    info = data['info']
+                    if info is None:
+                        _, info = account.delete()
+                        info = {k: v for k, v in info.items() if v}
+                        pbar.set_postfix(warning=f'Remove user {account} = {info}')
+                        continue
+
+                    params = data.pop('contest_addition_update_params', {})
+                    contest_addition_update = data.pop('contest_addition_update', params.pop('update', {}))
+                    contest_addition_update_by = data.pop('contest_addition_update_by', params.pop('by', None))
+                    if contest_addition_update or params.get('clear_rating_change'):
+                        account_update_contest_additions(
+                            account,
+                            contest_addition_update,
+                            timedelta_limit=timedelta(days=31) if account.info and not has_param else None,
+                            by=contest_addition_update_by,
+                            **params,
+                        )
+
+                    if 'rename' in data:
+                        with transaction.atomic():
+                            other, created = Account.objects.get_or_create(resource=account.resource,
+                                                                           key=data['rename'])
+                            new = MergedModelInstance.create(other, [account])
+                            account.delete()
+                            account = new
+                            account.save()
+
+                    coders = data.pop('coders', [])
+                    if coders:
+                        accounts_coders[account] = coders
+
+                    if info.get('country'):
+                        account.country = countrier.get(info['country'])
+                    if info.get('name'):
+                        account.name = info['name']
+                    if 'rating' in info:
+                        info['rating_ts'] = int(now.timestamp())
+                    delta = info.pop('delta', timedelta(days=365))
+                    if data.get('replace_info'):
+                        for k, v in account.info.items():
+                            if k.endswith('_') and k not in info:
+                                info[k] = v
+                        account.info = info
+                    else:
+                        account.info.update(info)
+                    account.updated = now + delta
+                    to_save.append(account)
+
+                    if len(to_save) >= batch_size:
+                        saved |= self.flush_accounts(resource, to_save, accounts_coders, batch_size)
+                saved |= self.flush_accounts(resource, to_save, accounts_coders, batch_size)
+        except Exception:
+            if not has_param:
+                accounts_ids = [a.pk for a in accounts if a.pk is not None and a.pk not in saved]
+                Account.objects.filter(pk__in=accounts_ids).update(updated=now + timedelta(days=1))
+            self.logger.error(f'resource = {resource}')
+            self.logger.error(format_exc())
+        self.logger.info(f'Parsed accounts infos (resource = {resource}): {count} of {total}')
+        return count, total
+
+    def parse_accounts_infos_by_workers(self, resources, workers, **kwargs):
+        resources_ids = list(resources.values_list('pk', flat=True))
+        count, total = run_by_workers(parse_accounts_infos_worker, resources_ids, kwargs, workers, self.logger)
+        self.logger.info(f'Parsed accounts infos by {workers} workers: {count} of {total}')
+        return count, total
+
     def handle(self, *args, **options):
         self.stdout.write(str(options))
         args = AttrDict(options)
@@ -55,99 +204,16 @@ class Command(BaseCommand):
         else:
             resources = Resource.objects.filter(module__has_accounts_infos_update=True)
 
-        countrier = Countrier()
-
-        now = timezone.now()
+        kwargs = dict(
+            now=timezone.now(),
+            query=args.query,
+            force=args.force,
+            limit=args.limit,
+            has_param=bool(has_param),
+            batch_size=args.batch_size,
+        )
+        if args.workers and args.workers > 1:
+            self.parse_accounts_infos_by_workers(resources, workers=args.workers, **kwargs)
+            return
         for resource in resources:
-            accounts = resource.account_set
-
-            if args.query:
-                accounts = accounts.filter(Q(key__iregex=args.query) | Q(name__iregex=args.query))
-            elif args.force:
-                accounts = accounts.order_by('updated')
-            else:
-                accounts = accounts.filter(Q(updated__isnull=True) | Q(updated__lte=now))
-
-            count, total = 0, accounts.count()
-            resource_info = resource.info.get('accounts', {})
-            if args.limit or not resource_info.get('nolimit', False) or resource_info.get('limit'):
-                limit = resource_info.get('limit') or args.limit or 1000
-                accounts = accounts[:limit]
-            accounts = list(accounts)
-
-            if not accounts:
-                continue
-
-            try:
-                with tqdm(total=len(accounts), desc=f'getting {resource.host} (total = {total})') as pbar:
-                    infos = resource.plugin.Statistic.get_users_infos(
-                        users=[a.key for a in accounts],
-                        resource=resource,
-                        accounts=accounts,
-                        pbar=pbar,
-                    )
-
-                    for account, data in zip(accounts, infos):
-                        with transaction.atomic():
-                            if data.get('skip'):
-                                continue
-                            count += 1
-                            info = data['info']
-                            if info is None:
-                                _, info = account.delete()
-                                info = {k: v for k, v in info.items() if v}
-                                pbar.set_postfix(warning=f'Remove user {account} = {info}')
-                                continue
-
-                            params = data.pop('contest_addition_update_params', {})
-                            contest_addition_update = data.pop('contest_addition_update', params.pop('update', {}))
-                            contest_addition_update_by = data.pop('contest_addition_update_by', params.pop('by', None))
-                            if contest_addition_update or params.get('clear_rating_change'):
-                                account_update_contest_additions(
-                                    account,
-                                    contest_addition_update,
-                                    timedelta_limit=timedelta(days=31) if account.info and not has_param else None,
-                                    by=contest_addition_update_by,
-                                    **params,
-                                )
-
-                            if 'rename' in data:
-                                other, created = Account.objects.get_or_create(resource=account.resource,
-                                                                               key=data['rename'])
-                                new = MergedModelInstance.create(other, [account])
-                                account.delete()
-                                account = new
-                                account.save()
-
-                            coders = data.pop('coders', [])
-                            if coders:
-                                qs = Coder.objects \
-                                    .filter(account__resource=resource, account__key__in=coders) \
-                                    .exclude(account=account)
-                                for c in qs:
-                                    account.coders.add(c)
-
-                            if info.get('country'):
-                                account.country = countrier.get(info['country'])
-                            if info.get('name'):
-                                account.name = info['name']
-                            if 'rating' in info:
-                                info['rating_ts'] = int(now.timestamp())
-                            delta = info.pop('delta', timedelta(days=365))
-                            if data.get('replace_info'):
-                                for k, v in account.info.items():
-                                    if k.endswith('_') and k not in info:
-                                        info[k] = v
-                                account.info = info
-                            else:
-                                account.info.update(info)
-                            account.updated = now + delta
-                            account.save()
-            except Exception:
-                if not has_param:
-                    for account in tqdm(accounts, desc='changing update time'):
-                        account.updated = now + timedelta(days=1)
-                        account.save()
-                self.logger.error(f'resource = {resource}')
-                self.logger.error(format_exc())
-            self.logger.info(f'Parsed accounts infos (resource = {resource}): {count} of {total}')
+            self.parse_resource_accounts_infos(resource, **kwargs)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connection
+
+from utils.requester import requester
+
+
+class ParseProfiler:
+    """
+    Per contest phases spans with queries and http requests counts.
+    Phase lasts until next phase is switched on, records are logged as json and aggregated by resources and phases.
+    Queries are counted inside with block, summary is logged on exit.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.record = None
+        self.n_queries = 0
+        self.phases = defaultdict(Counter)
+        self.resources = defaultdict(Counter)
+        self.stack = ExitStack()
+
+    def __enter__(self):
+        self.stack.enter_context(connection.execute_wrapper(self.count_query))
+        return self
+
+    def __exit__(self, *args):
+        self.summary()
+
+    def count_query(self, execute, sql, params, many, context):
+        self.n_queries += 1
+        return execute(sql, params, many, context)
+
+    def checkpoint(self):
+        return time.perf_counter(), self.n_queries, requester.counter_requests, requester.counter_cache_hits
+
+    @staticmethod
+    def add_stat(stat, start, end):
+        stat['time'] += end[0] - start[0]
+        stat['queries'] += end[1] - start[1]
+        stat['requests'] += end[2] - start[2]
+        stat['cache_hits'] += end[3] - start[3]
+
+    @contextmanager
+    def span(self, name):
+        start = self.checkpoint()
+        try:
+            yield
+        finally:
+            self.add_stat(self.phases[name], start, self.checkpoint())
+
+    def start(self, contest):
+        self.record = {
+            'contest': contest.pk,
+            'resource': contest.resource.host,
+            'phases': defaultdict(Counter),
+            'counters': Counter(),
+        }
+        self.phase_name = 'init'
+        self.phase_start = self.start_point = self.checkpoint()
+
+    def phase(self, name):
+        if self.record is None:
+            return
+        point = self.checkpoint()
+        self.add_stat(self.record['phases'][self.phase_name], self.phase_start, point)
+        self.phase_name = name
+        self.phase_start = point
+
+    def count(self, name, value=1):
+        if self.record is not None:
+            self.record['counters'][name] += value
+
+    def finish(self, **kwargs):
+        if self.record is None:
+            return
+        self.phase(None)
+        record = self.record
+        self.record = None
+        record['time'] = self.phase_start[0] - self.start_point[0]
+        record.update(kwargs)
+
+        resource = self.resources[record['resource']]
+        resource['contests'] += 1
+        resource['time'] += record['time']
+        for name, stat in record['phases'].items():
+            self.phases[name].update(stat)
+            resource[f'{name}_time'] += stat['time']
+            resource['queries'] += stat['queries']
+            resource['requests'] += stat['requests']
+        resource.update(record['counters'])
+
+        self.logger.info(json.dumps(record, default=str))
+
+    def summary(self):
+        self.stack.close()
+        if not self.resources:
+            return
+        self.logger.info(json.dumps({'summary': True, 'phases': self.phases, 'resources': self.resources}))
@@ -3,16 +3,23 @@
 
 import copy
 import operator
+import os
 import re
+import socket
+import threading
 from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from contextlib import contextmanager
 from datetime import timedelta
+from functools import lru_cache
 from html import unescape
+from itertools import chain
 from logging import getLogger
 from random import shuffle
 
 from attrdict import AttrDict
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connections, transaction
 from django.db.models import Exists, F, OuterRef, Q
 from django.utils import timezone
 from tqdm import tqdm
@@ -21,11 +28,128 @@ from traceback_with_variables import format_exc
 from clist.models import Contest, Resource, TimingContest
 from clist.templatetags.extras import canonize, get_number_from_str, get_problem_short
 from clist.views import update_problems, update_writers
-from ranking.management.commands.common import account_update_contest_additions
+from ranking.management.commands.common import (account_update_contest_additions, add_workers_argument,
+                                                run_by_workers)
 from ranking.management.commands.countrier import Countrier
+from ranking.management.commands.parse_profiler import ParseProfiler
+from ranking.management.commands.problems_statistics import ProblemsStatistics
 from ranking.management.modules.common import REQ
 from ranking.management.modules.excepts import ExceptionParseStandings, InitModuleException
-from ranking.models import Account, Module, Stage, Statistics
+from ranking.models import Account, Module, Stage, Statistics, deferred_counters
+
+
+@lru_cache(maxsize=None)
+def normalize_field(k):
+    if k[0].isalpha() and not re.match('^[A-Z]+$', k):
+        k = k[0].upper() + k[1:]
+        k = '_'.join(map(str.lower, re.findall('[A-ZА-Я][^A-ZА-Я]*', k)))
+    return k
+
+
+STANDINGS_HEADER_FIELDS = (
+    'url', 'title', 'options', 'info_fields', 'writers', 'problems_time_format',
+)
+
+
+def merge_standings_chunks(standings, chunks):
+    """
+    Yield results of next chunks and merge other fields into standings, chunks are fetched inside requester context.
+    Contest fields are applied before results and must come with the first chunk,
+    hidden fields of chunk are applied to rows of the chunk and next chunks.
+    """
+    with REQ:
+        for chunk in chunks:
+            header_fields = [field for field in STANDINGS_HEADER_FIELDS if field in chunk]
+            if 'division' in chunk.get('problems', {}) and 'division' not in standings.get('problems', {}):
+                header_fields.append('problems')
+            if header_fields:
+                raise ExceptionParseStandings(f'Fields {header_fields} must come with first standings chunk')
+            result = chunk.pop('result', None)
+            standings.update(chunk)
+            if result:
+                yield result
+
+
+class StoredAdditions(Mapping):
+    """
+    Lazy additions of stored statistics by account key for chunked standings.
+    Only additions of last prefetched keys are kept in memory, other keys are loaded by one.
+    """
+
+    def __init__(self, statistics):
+        self.statistics = statistics
+        self.additions = {}
+        self.n_statistics = None
+
+    def prefetch(self, keys):
+        additions = dict.fromkeys(keys)
+        statistics = self.statistics.filter(account__key__in=list(additions))
+        additions.update(statistics.values_list('account__key', 'addition'))
+        self.additions = additions
+
+    def __getitem__(self, key):
+        if key not in self.additions:
+            statistics = self.statistics.filter(account__key=key)
+            self.additions[key] = statistics.values_list('addition', flat=True).first()
+        addition = self.additions[key]
+        if addition is None:
+            raise KeyError(key)
+        return addition
+
+    def __iter__(self):
+        return self.statistics.values_list('account__key', flat=True).iterator()
+
+    def __len__(self):
+        if self.n_statistics is None:
+            self.n_statistics = self.statistics.count()
+        return self.n_statistics
+
+
+def iterate_results_with_additions(results, additions):
+    for result in results:
+        if additions:
+            for v in result.values():
+                for field in [v.get('member'), v.get('name')]:
+                    v.update(OrderedDict(additions.pop(field, [])))
+        yield result
+    if additions:
+        yield {k: dict(v) for k, v in additions.items()}
+
+
+@contextmanager
+def keep_leases(owner, interval=TimingContest.LEASE_DURATION / 4):
+    """
+    Yield dict of leased timings by contests ids, leases are renewed in background thread while they are in dict.
+    Leases left in dict are released on exit.
+    """
+    timings = {}
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(interval.total_seconds()):
+                TimingContest.renew_leases(list(timings.values()), owner)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield timings
+    finally:
+        stop.set()
+        thread.join()
+        TimingContest.release_leases(list(timings), owner)
+
+
+def parse_statistic_worker(contests_statistics, kwargs):
+    contests = Contest.objects.filter(pk__in=contests_statistics.keys())
+    return Command().parse_statistic(
+        contests,
+        without_contest_filter=True,
+        contests_statistics=contests_statistics,
+        **kwargs,
+    )
 
 
 class Command(BaseCommand):
@@ -55,6 +179,9 @@ class Command(BaseCommand):
         parser.add_argument('--stage', action='store_true', default=False, help='Stage contests')
         parser.add_argument('--division', action='store_true', default=False, help='Contests with divisions')
         parser.add_argument('--force-problems', action='store_true', default=False, help='Force update problems')
+        parser.add_argument('--force-standings', action='store_true', default=False,
+                            help='Update results even if standings are unchanged')
+        add_workers_argument(parser)
 
     def parse_statistic(
         self,
@@ -73,10 +200,15 @@ class Command(BaseCommand):
         update_without_new_rating=None,
         without_contest_filter=False,
         force_problems=False,
+        force_standings=False,
+        workers=None,
+        contests_statistics=None,
     ):
         now = timezone.now()
 
         contests = contests.select_related('resource__module', 'timing')
+        contests = contests.filter(TimingContest.free_lease_filter(now, prefix='timing__'))
+        lease_owner = f'{socket.gethostname()}:{os.getpid()}'
 
         if not without_contest_filter:
             if with_check:
@@ -107,22 +239,31 @@ class Command(BaseCommand):
         if limit:
             contests = contests.order_by('-start_time')[:limit]
 
-        with transaction.atomic():
-            for c in contests:
-                module = c.resource.module
-                delay_on_success = module.delay_on_success or module.max_delay_after_end
-                if now < c.end_time:
-                    if c.end_time - c.start_time <= timedelta(seconds=limit_duration_in_secs):
-                        delay_on_success = timedelta(minutes=0)
-                    elif c.end_time < now + delay_on_success:
-                        delay_on_success = c.end_time - now + timedelta(seconds=5)
-                TimingContest.objects.update_or_create(contest=c, defaults={'statistic': now + delay_on_success})
+        if workers and workers > 1:
+            return self.parse_statistic_by_workers(
+                contests,
+                workers=workers,
+                with_check=with_check,
+                stop_on_error=stop_on_error,
+                random_order=random_order,
+                no_update_results=no_update_results,
+                limit_duration_in_secs=limit_duration_in_secs,
+                users=users,
+                with_stats=with_stats,
+                update_without_new_rating=update_without_new_rating,
+                force_problems=force_problems,
+                force_standings=force_standings,
+            )
+
+        contests = list(contests)
+        if contests_statistics is None:
+            contests_statistics = {c.pk: self.get_timing_statistic(c) for c in contests}
 
         if random_order:
-            contests = list(contests)
             shuffle(contests)
 
         countrier = Countrier()
+        profiler = ParseProfiler(getLogger('ranking.parse.statistic.profile'))
 
         def canonize_name(name):
             while True:
@@ -137,569 +278,783 @@ class Command(BaseCommand):
         count = 0
         total = 0
         n_upd_account_time = 0
+        n_written_statistics = 0
+        n_skipped_statistics = 0
+        n_unchanged_standings = 0
         progress_bar = tqdm(contests)
         stages_ids = []
-        for contest in progress_bar:
-            resource = contest.resource
-            if not hasattr(resource, 'module'):
-                self.logger.error('Not found module contest = %s' % c)
-                continue
-            progress_bar.set_description(f'contest = {contest.title}')
-            progress_bar.refresh()
-            total += 1
-            parsed = False
-            user_info_has_rating = {}
-            try:
-                r = {}
-
-                if hasattr(contest, 'stage'):
-                    contest.stage.update()
-                    count += 1
-                    parsed = True
+        stages_statistics_cache = {}
+        with profiler, keep_leases(lease_owner) as leases:
+            for contest in progress_bar:
+                resource = contest.resource
+                if not hasattr(resource, 'module'):
+                    self.logger.error('Not found module contest = %s' % contest)
                     continue
-
-                plugin = resource.plugin.Statistic(contest=contest)
-
-                with REQ:
-                    statistics_by_key = {} if with_stats else None
-                    statistics_ids = set()
-                    has_statistics = False
-                    if not no_update_results and (users or users is None):
-                        statistics = Statistics.objects.filter(contest=contest).select_related('account')
-                        if users:
-                            statistics = statistics.filter(account__key__in=users)
-                        for s in tqdm(statistics.iterator(), 'getting parsed statistics'):
-                            if with_stats:
-                                statistics_by_key[s.account.key] = s.addition
-                            statistics_ids.add(s.pk)
-                            has_statistics = with_stats
-                    standings = plugin.get_standings(users=users, statistics=statistics_by_key)
-
-                with transaction.atomic():
-                    if 'url' in standings and standings['url'] != contest.standings_url:
-                        contest.standings_url = standings['url']
-                        contest.save()
-
-                    if 'title' in standings and standings['title'] != contest.title:
-                        contest.title = standings['title']
-                        contest.save()
-
-                    if 'options' in standings:
-                        contest_options = contest.info.get('standings', {})
-                        standings_options = dict(contest_options)
-                        standings_options.update(standings.pop('options'))
-
-                        canonized_fixed_fields = set([canonize(f) for f in standings_options.get('fixed_fields', [])])
-                        for field in contest_options.get('fixed_fields', []):
-                            canonize_field = canonize(field)
-                            if canonize_field not in canonized_fixed_fields:
-                                canonized_fixed_fields.add(canonize_field)
-                                standings_options['fixed_fields'].append(field)
-
-                        if canonize(standings_options) != canonize(contest_options):
-                            contest.info['standings'] = standings_options
-                            contest.save()
-
-                    info_fields = standings.pop('info_fields', []) + ['divisions_order']
-                    for field in info_fields:
-                        if standings.get(field) is not None and contest.info.get(field) != standings[field]:
-                            contest.info[field] = standings[field]
-                            contest.save()
-
-                    update_writers(contest, standings.pop('writers', None))
-
-                    problems_time_format = standings.pop('problems_time_format', '{M}:{s:02d}')
-
-                    standings_hidden_fields = standings.pop('hidden_fields', [])
-                    standings_hidden_fields_set = set(standings_hidden_fields)
-
-                    result = standings.get('result', {})
-                    if no_update_results:
-                        problems = standings.pop('problems', None)
-                        if problems:
-                            if contest.info.get('problems'):
-                                problems = plugin.merge_dict(problems, contest.info['problems'])
-                            update_problems(contest, problems)
+                progress_bar.set_description(f'contest = {contest.title}')
+                progress_bar.refresh()
+                # contest is leased right before parsing to share due contests with other processes
+                timing = self.claim_contest(contest, contests_statistics.get(contest.pk), lease_owner,
+                                            limit_duration_in_secs)
+                if timing is None:
+                    continue
+                contest.timing = timing
+                leases[contest.pk] = timing
+                total += 1
+                parsed = False
+                user_info_has_rating = {}
+                profiler.start(contest)
+                try:
+                    r = {}
+
+                    if hasattr(contest, 'stage'):
+                        profiler.phase('stage')
+                        contest.stage.update(statistics_cache=stages_statistics_cache)
                         count += 1
+                        parsed = True
                         continue
 
-                    if result or users is not None:
-                        fields_set = set()
-                        fields_types = {}
-                        fields = list()
-                        addition_was_ordereddict = False
-                        calculate_time = False
-                        n_statistics = defaultdict(int)
-                        d_problems = {}
-                        teams_viewed = set()
-                        has_hidden = False
-                        languages = set()
-                        hidden_fields = set()
-                        medals_skip = set()
-
-                        additions = copy.deepcopy(contest.info.get('additions', {}))
-                        if additions:
-                            for k, v in result.items():
-                                for field in [v.get('member'), v.get('name')]:
-                                    v.update(OrderedDict(additions.pop(field, [])))
-                            for k, v in additions.items():
-                                result[k] = dict(v)
-
-                        for r in tqdm(list(result.values()), desc=f'update results {contest}'):
-                            for k, v in r.items():
-                                if isinstance(v, str) and chr(0x00) in v:
-                                    r[k] = v.replace(chr(0x00), '')
-                            member = r.pop('member')
-                            account_action = r.pop('action', None)
-                            skip_result = r.get('_no_update_n_contests')
-
-                            if account_action == 'delete':
-                                Account.objects.filter(resource=resource, key=member).delete()
-                                continue
-
-                            account, created = Account.objects.get_or_create(resource=resource, key=member)
-
-                            if not contest.info.get('_no_update_account_time') and not skip_result:
-                                stats = (statistics_by_key or {}).get(member, {})
-                                no_rating = with_stats and 'new_rating' not in stats and 'rating_change' not in stats
-
-                                resource_statistics = contest.resource.info.get('statistics', {})
-                                updated_delta = resource_statistics.get('account_updated_delta', {'days': 1})
-                                updated = now + timedelta(**updated_delta)
-                                wait_rating = resource_statistics.get('wait_rating')
-
-                                if no_rating and wait_rating and has_statistics:
-                                    updated = now + timedelta(hours=1)
-                                    title_re = wait_rating.get('title_re')
-                                    if (
-                                        (
-                                            contest.end_time + timedelta(days=wait_rating['days']) > now
-                                            or update_without_new_rating
-                                        )
-                                        and (not title_re or re.search(title_re, contest.title))
-                                        and updated < account.updated
-                                    ):
-                                        division = r.get('division')
-                                        if division not in user_info_has_rating:
-                                            generator = plugin.get_users_infos([member], contest.resource, [account])
-                                            try:
-                                                user_info = next(generator)
-                                                params = user_info.get('contest_addition_update_params', {})
-                                                field = user_info.get('contest_addition_update_by') or params.get('by') or 'key'  # noqa
-                                                updates = user_info.get('contest_addition_update') or params.get('update') or {}  # noqa
-                                                if not isinstance(field, (list, tuple)):
-                                                    field = [field]
-                                                user_info_has_rating[division] = False
-                                                for f in field:
-                                                    if getattr(contest, f) in updates:
-                                                        user_info_has_rating[division] = True
-                                                        break
-                                            except Exception:
-                                                self.logger.error(format_exc())
-                                                user_info_has_rating[division] = False
+                    plugin = resource.plugin.Statistic(contest=contest)
 
-                                        if user_info_has_rating[division]:
-                                            n_upd_account_time += 1
-                                            account.updated = updated
-                                            account.save()
-                                elif (
-                                    created
-                                    or (not has_statistics and updated < account.updated)
-                                    or (update_without_new_rating and updated < account.updated and no_rating)
-                                ):
-                                    n_upd_account_time += 1
-                                    account.updated = updated
-                                    account.save()
-
-                            if contest.info.get('_push_name_instead_key'):
-                                r['_name_instead_key'] = True
-                            if contest.info.get('_push_name_instead_key_to_account'):
-                                account.info['_name_instead_key'] = True
-                                account.save()
-
-                            no_update_name = r.pop('_no_update_name', False)
-                            field_update_name = r.pop('_field_update_name', 'name')
-                            if r.get(field_update_name):
-                                r[field_update_name] = canonize_name(r[field_update_name])
-                                if (
-                                    not no_update_name and
-                                    account.name != r[field_update_name]
-                                ):
-                                    account.name = r[field_update_name]
-                                    account.save()
-
-                            country = r.get('country', None)
-                            if country:
-                                country = countrier.get(country)
-                                if country and country != account.country:
-                                    account.country = country
-                                    account.save()
-
-                            contest_addition_update = r.pop('contest_addition_update', {})
-                            if contest_addition_update:
-                                account_update_contest_additions(
-                                    account,
-                                    contest_addition_update,
-                                    timedelta(days=31) if with_check else None
+                    calc_time = contest.calculate_time or (
+                        contest.start_time <= now < contest.end_time and
+                        not contest.resource.info.get('parse', {}).get('no_calculate_time', False)
+                    )
+
+                    with REQ:
+                        profiler.phase('load_statistics')
+                        statistics_by_key = {} if with_stats else None
+                        statistics_ids = set()
+                        load_statistics = not no_update_results and (users or users is None)
+                        if load_statistics:
+                            statistics = Statistics.objects.filter(contest=contest)
+                            if users:
+                                statistics = statistics.filter(account__key__in=users)
+                            statistics_ids = set(statistics.values_list('pk', flat=True))
+                            if with_stats and plugin.has_standings_chunks:
+                                statistics_by_key = StoredAdditions(statistics)
+                            elif with_stats:
+                                statistics = statistics.values_list('account__key', 'addition')
+                                for key, addition in tqdm(statistics.iterator(), 'getting parsed statistics'):
+                                    statistics_by_key[key] = addition
+                        has_statistics = with_stats and bool(statistics_ids)
+                        profiler.count('loaded_statistics', len(statistics_ids))
+                        profiler.phase('get_standings')
+                        standings_chunks = plugin.get_standings_chunks(users=users, statistics=statistics_by_key)
+                        standings = next(standings_chunks)
+                        result_chunks = merge_standings_chunks(standings, standings_chunks)
+                        if not standings.get('result'):
+                            result = next(result_chunks, None)
+                            if result:
+                                standings['result'] = result
+                        profiler.phase('contest')
+
+                    # rows are processed while waiting rating to probe accounts infos for new rating
+                    wait_rating = resource.info.get('statistics', {}).get('wait_rating')
+                    is_waiting_rating = wait_rating and (
+                        contest.end_time + timedelta(days=wait_rating['days']) > now
+                        or update_without_new_rating
+                    )
+                    standings_hash = None
+                    if (
+                        users is None
+                        and not no_update_results
+                        and 'result' in standings
+                        and not plugin.has_standings_chunks
+                        and contest.end_time < now
+                        and not is_waiting_rating
+                    ):
+                        standings_hash = Statistics.get_fingerprint(standings)
+                        fingerprint = Statistics.get_fingerprint(standings_hash, contest.info, resource.info)
+                        if (
+                            fingerprint is not None
+                            and fingerprint == contest.timing.standings_fingerprint
+                            and not force_problems
+                            and not force_standings
+                        ):
+                            timing_statistic_delta = standings.get('timing_statistic_delta')
+                            if timing_statistic_delta is None:
+                                for row in standings['result'].values():
+                                    if any('?' in str(p.get('result', '')) for p in row.get('problems', {}).values()):
+                                        timing_statistic_delta = timedelta(minutes=30)
+                                        break
+                            # explicit delta of module and re-poll of hidden results are kept without backoff
+                            if timing_statistic_delta is not None:
+                                contest.timing.statistic = timezone.now() + timing_statistic_delta
+                            else:
+                                contest.timing.update_statistic_backoff(
+                                    changed=False,
+                                    min_delay=resource.module.min_delay_on_unchanged,
+                                    max_delay=resource.module.max_delay_on_unchanged,
                                 )
+                            contest.timing.save()
+                            n_unchanged_standings += 1
+                            profiler.count('unchanged_standings')
+                            progress_bar.set_postfix(unchanged=True)
+                            count += 1
+                            parsed = True
+                            continue
+
+                    with transaction.atomic(), deferred_counters:
+                        if 'url' in standings and standings['url'] != contest.standings_url:
+                            contest.standings_url = standings['url']
+                            contest.save()
 
-                            account_info = r.pop('info', {})
-                            if account_info:
-                                if 'rating' in account_info:
-                                    account_info['rating_ts'] = int(now.timestamp())
-                                account.info.update(account_info)
-                                account.save()
+                        if 'title' in standings and standings['title'] != contest.title:
+                            contest.title = standings['title']
+                            contest.save()
 
-                            default_division = contest.info.get('default_division')
-                            if default_division and 'division' not in r:
-                                r['division'] = default_division
-
-                            problems = r.get('problems', {})
-
-                            _languages = set()
-                            for problem in problems.values():
-                                if problem.get('language'):
-                                    languages.add(problem['language'])
-                                    _languages.add(problem['language'])
-                            if '_languages' not in r and _languages:
-                                r['_languages'] = list(sorted(_languages))
-
-                            if ('team_id' not in r or r['team_id'] not in teams_viewed) and not skip_result:
-                                if 'team_id' in r:
-                                    teams_viewed.add(r['team_id'])
-                                solved = {'solving': 0}
-                                if r.get('division'):
-                                    n_statistics[r.get('division')] += 1
-                                n_statistics['__total__'] += 1
-                                for k, v in problems.items():
-                                    if 'result' not in v:
-                                        continue
+                        if 'options' in standings:
+                            contest_options = contest.info.get('standings', {})
+                            standings_options = dict(contest_options)
+                            standings_options.update(standings.pop('options'))
 
-                                    p = d_problems
-                                    if 'division' in standings.get('problems', {}):
-                                        p = p.setdefault(r['division'], {})
-                                    p = p.setdefault(k, {})
+                            fixed_fields = standings_options.get('fixed_fields', [])
+                            canonized_fixed_fields = set([canonize(f) for f in fixed_fields])
+                            for field in contest_options.get('fixed_fields', []):
+                                canonize_field = canonize(field)
+                                if canonize_field not in canonized_fixed_fields:
+                                    canonized_fixed_fields.add(canonize_field)
+                                    standings_options['fixed_fields'].append(field)
 
-                                    scored = str(v['result']).startswith('+')
-                                    try:
-                                        scored = scored or float(v['result']) > 0
-                                    except Exception:
-                                        pass
+                            if canonize(standings_options) != canonize(contest_options):
+                                contest.info['standings'] = standings_options
+                                contest.save()
 
-                                    default_full_score = (
-                                        contest.info.get('default_problem_full_score')
-                                        or contest.resource.info.get('statistics', {}).get('default_problem_full_score')
-                                    )
-                                    if default_full_score:
-                                        if 'partial' not in v and default_full_score - float(v['result']) > 1e-9:
-                                            v['partial'] = True
-                                        if not v.get('partial'):
-                                            solved['solving'] += 1
-                                        if 'full_score' not in p:
-                                            p['full_score'] = default_full_score
-                                    ac = scored and not v.get('partial', False)
-
-                                    if contest.info.get('with_last_submit_time') and scored:
-                                        if '_last_submit_time' not in r or r['_last_submit_time'] < v['time']:
-                                            r['_last_submit_time'] = v['time']
-                                    if contest.info.get('without_problem_first_ac'):
-                                        v.pop('first_ac', None)
-                                        v.pop('first_ac_of_all', None)
-                                    if contest.info.get('without_problem_time'):
-                                        v.pop('time', None)
-
-                                    if r.get('_skip_for_problem_stat'):
-                                        continue
+                        info_fields = standings.pop('info_fields', []) + ['divisions_order']
+                        for field in info_fields:
+                            if standings.get(field) is not None and contest.info.get(field) != standings[field]:
+                                contest.info[field] = standings[field]
+                                contest.save()
 
-                                    p['n_teams'] = p.get('n_teams', 0) + 1
+                        profiler.phase('writers')
+                        update_writers(contest, standings.pop('writers', None))
+                        profiler.phase('contest')
 
-                                    if ac:
-                                        p['n_accepted'] = p.get('n_accepted', 0) + 1
-                                    elif scored and v.get('partial'):
-                                        p['n_partial'] = p.get('n_partial', 0) + 1
-                                    elif str(v['result']).startswith('?'):
-                                        p['n_hidden'] = p.get('n_hidden', 0) + 1
+                        problems_time_format = standings.pop('problems_time_format', '{M}:{s:02d}')
 
-                                if 'default_problem_full_score' in contest.info and solved and 'solved' not in r:
-                                    r['solved'] = solved
+                        standings_hidden_fields = standings.pop('hidden_fields', [])
+                        standings_hidden_fields_set = set(standings_hidden_fields)
 
-                            calc_time = contest.calculate_time or (
-                                contest.start_time <= now < contest.end_time and
-                                not contest.resource.info.get('parse', {}).get('no_calculate_time', False)
+                        result = standings.get('result', {})
+                        if no_update_results:
+                            problems = standings.pop('problems', None)
+                            if problems:
+                                if contest.info.get('problems'):
+                                    problems = plugin.merge_dict(problems, contest.info['problems'])
+                                profiler.phase('problems')
+                                update_problems(contest, problems)
+                            count += 1
+                            continue
+
+                        if result or users is not None:
+                            fields_set = set()
+                            fields_types = {}
+                            fields = list()
+                            addition_was_ordereddict = False
+                            calculate_time = False
+                            n_statistics = defaultdict(int)
+                            problems_statistics = ProblemsStatistics()
+                            teams_viewed = set()
+                            has_hidden = False
+                            languages = set()
+                            hidden_fields = set()
+                            medals_skip = set()
+                            n_contest_written_statistics = 0
+
+                            # contest options used for every row
+                            no_update_account_time = contest.info.get('_no_update_account_time')
+                            resource_statistics = contest.resource.info.get('statistics', {})
+                            updated_delta = resource_statistics.get('account_updated_delta', {'days': 1})
+                            wait_rating = resource_statistics.get('wait_rating')
+                            push_name_instead_key = contest.info.get('_push_name_instead_key')
+                            push_name_instead_key_to_account = contest.info.get('_push_name_instead_key_to_account')
+                            default_division = contest.info.get('default_division')
+                            default_full_score = (
+                                contest.info.get('default_problem_full_score')
+                                or resource_statistics.get('default_problem_full_score')
                             )
-
+                            with_solved = 'default_problem_full_score' in contest.info
+                            with_last_submit_time = contest.info.get('with_last_submit_time')
+                            without_problem_first_ac = contest.info.get('without_problem_first_ac')
+                            without_problem_time = contest.info.get('without_problem_time')
                             advance = contest.info.get('advance')
-                            if advance:
-                                k = 'advanced'
-                                r.pop(k, None)
-                                for cond in advance['filter']:
-                                    field = cond['field']
-                                    value = r.get(field)
-                                    value = get_number_from_str(value)
-                                    if value is None:
-                                        continue
-                                    r[k] = getattr(operator, cond['operator'])(value, cond['threshold'])
-
                             medals = contest.info.get('standings', {}).get('medals')
                             if medals:
-                                k = 'medal'
-                                r.pop(k, None)
-                                if 'place' in r:
-                                    place = get_number_from_str(r['place'])
-                                    if member in contest.info.get('standings', {}).get('medals_skip', []):
-                                        medals_skip.add(member)
-                                    elif place:
-                                        place -= len(medals_skip)
-                                        for medal in medals:
-                                            if place <= medal['count']:
-                                                r[k] = medal['name']
-                                                if 'field' in medal:
-                                                    r[medal['field']] = medal['value']
-                                                    r[f'_{k}_title_field'] = medal['field']
-                                                break
-                                            place -= medal['count']
-                                medal_fields = [m['field'] for m in medals if 'field' in m] or [k]
-                                for f in medal_fields:
-                                    if f not in fields_set:
-                                        fields_set.add(f)
-                                        fields.append(f)
-
-                            defaults = {
-                                'place': r.pop('place', None),
-                                'solving': r.pop('solving', 0),
-                                'upsolving': r.pop('upsolving', 0),
-                            }
-                            defaults = {k: v for k, v in defaults.items() if v != '__unchanged__'}
-
-                            addition = type(r)()
-                            addition_was_ordereddict |= isinstance(addition, OrderedDict)
-                            for k, v in r.items():
-                                is_hidden_field = k in standings_hidden_fields_set
-                                if k[0].isalpha() and not re.match('^[A-Z]+$', k):
-                                    k = k[0].upper() + k[1:]
-                                    k = '_'.join(map(str.lower, re.findall('[A-ZА-Я][^A-ZА-Я]*', k)))
-
-                                if is_hidden_field:
-                                    hidden_fields.add(k)
-                                if k not in fields_set:
-                                    fields_set.add(k)
-                                    fields.append(k)
-
-                                if (k in Resource.RATING_FIELDS or k == 'rating_change') and v is None:
-                                    continue
-
-                                fields_types.setdefault(k, set()).add(type(v).__name__)
-                                addition[k] = v
-
-                            if (
-                                addition.get('rating_change') is None
-                                and addition.get('new_rating') is not None
-                                and addition.get('old_rating') is not None
-                            ):
-                                delta = addition['new_rating'] - addition['old_rating']
-                                f = 'rating_change'
-                                addition[f] = f'{"+" if delta > 0 else ""}{delta}'
-                                if f not in fields_set:
-                                    fields_set.add(f)
-                                    fields.append(f)
-
-                            if 'is_rated' in addition and not addition['is_rated']:
-                                addition.pop('old_rating', None)
-
-                            if not calc_time:
-                                defaults['addition'] = addition
-
+                                medals_skip_members = set(contest.info.get('standings', {}).get('medals_skip', []))
+                                medal_fields = [m['field'] for m in medals if 'field' in m] or ['medal']
                             rating_ts = int(min(contest.end_time, now).timestamp())
-                            if 'new_rating' in addition and (
-                                'rating_ts' not in account.info or account.info['rating_ts'] <= rating_ts
-                            ):
-                                account.info['rating_ts'] = rating_ts
-                                account.info['rating'] = addition['new_rating']
-                                account.save()
-
-                            statistic, created = Statistics.objects.update_or_create(
-                                account=account,
-                                contest=contest,
-                                defaults=defaults,
-                            )
-
-                            if not created:
-                                statistics_ids.remove(statistic.pk)
-
-                                if calc_time:
-                                    p_problems = statistic.addition.get('problems', {})
-
-                                    ts = min(int((now - contest.start_time).total_seconds()), contest.duration_in_secs)
-                                    values = {
-                                        'D': ts // (24 * 60 * 60),
-                                        'H': ts // (60 * 60),
-                                        'h': ts // (60 * 60) % 24,
-                                        'M': ts // 60,
-                                        'm': ts // 60 % 60,
-                                        'S': ts,
-                                        's': ts % 60,
+                            if calc_time:
+                                ts = min(int((now - contest.start_time).total_seconds()), contest.duration_in_secs)
+                                values = {
+                                    'D': ts // (24 * 60 * 60),
+                                    'H': ts // (60 * 60),
+                                    'h': ts // (60 * 60) % 24,
+                                    'M': ts // 60,
+                                    'm': ts // 60 % 60,
+                                    'S': ts,
+                                    's': ts % 60,
+                                }
+                                calc_time_value = problems_time_format.format(**values)
+
+                            additions = copy.deepcopy(contest.info.get('additions', {}))
+                            with_division_problems = 'division' in standings.get('problems', {})
+                            stored_statistics = None
+                            results = iterate_results_with_additions(chain([result], result_chunks), additions)
+                            for result in results:
+                                upsert_statistics = {}
+                                accounts_updates = defaultdict(set)
+                                profiler.count('rows', len(result))
+                                for field in standings.pop('hidden_fields', []):
+                                    if field not in standings_hidden_fields_set:
+                                        standings_hidden_fields_set.add(field)
+                                        standings_hidden_fields.append(field)
+
+                                profiler.phase('accounts')
+                                members = []
+                                for r in result.values():
+                                    for k, v in r.items():
+                                        if isinstance(v, str) and chr(0x00) in v:
+                                            r[k] = v.replace(chr(0x00), '')
+                                    if r.get('action') != 'delete':
+                                        members.append(r['member'])
+                                accounts, created_members = Account.objects.bulk_get_or_create(resource, members)
+                                profiler.count('created_accounts', len(created_members))
+                                if isinstance(statistics_by_key, StoredAdditions):
+                                    statistics_by_key.prefetch(members)
+
+                                # stored rows of chunk are loaded with chunk to keep memory bounded
+                                if load_statistics and (stored_statistics is None or plugin.has_standings_chunks):
+                                    profiler.phase('stored_statistics')
+                                    statistics = Statistics.objects.filter(contest=contest)
+                                    if plugin.has_standings_chunks:
+                                        statistics = statistics.filter(
+                                            account_id__in=[account.pk for account in accounts.values()],
+                                        )
+                                    stored_fields = ['account_id', 'pk', 'fingerprint']
+                                    if calc_time:
+                                        stored_fields.append('addition')
+                                    stored_statistics = {
+                                        account_id: values
+                                        for account_id, *values in statistics.values_list(*stored_fields).iterator()
                                     }
-                                    time = problems_time_format.format(**values)
-
-                                    for k, v in problems.items():
-                                        v_result = v.get('result', '')
-                                        if isinstance(v_result, str) and '?' in v_result:
-                                            calculate_time = True
-                                        p = p_problems.get(k, {})
-                                        if 'time' in v:
-                                            continue
-                                        has_change = v.get('result') != p.get('result')
-                                        if (not has_change or contest.end_time < now) and 'time' in p:
-                                            v['time'] = p['time']
-                                        else:
-                                            v['time'] = time
 
-                            for p in problems.values():
-                                p_result = p.get('result', '')
-                                if isinstance(p_result, str) and '?' in p_result:
-                                    has_hidden = True
+                                profiler.phase('rows')
 
-                            if calc_time:
-                                statistic.addition = addition
-                                statistic.save()
+                                for r in tqdm(list(result.values()), desc=f'update results {contest}'):
+                                    member = r.pop('member')
+                                    account_action = r.pop('action', None)
+                                    skip_result = r.get('_no_update_n_contests')
 
-                        if users is None:
-                            timing_statistic_delta = standings.get(
-                                'timing_statistic_delta',
-                                timedelta(minutes=30) if has_hidden and contest.end_time < now else None,
-                            )
-                            if timing_statistic_delta is not None:
-                                contest.timing.statistic = timezone.now() + timing_statistic_delta
-                                contest.timing.save()
+                                    if account_action == 'delete':
+                                        Account.objects.filter(resource=resource, key=member).delete()
+                                        continue
 
-                            if contest.start_time <= now:
-                                if now < contest.end_time:
-                                    contest.info['last_parse_statistics'] = now.strftime('%Y-%m-%d %H:%M:%S.%f+%Z')
-                                elif 'last_parse_statistics' in contest.info:
-                                    contest.info.pop('last_parse_statistics')
+                                    account = accounts[member]
+                                    created = member in created_members
 
-                            if fields_set and not addition_was_ordereddict:
-                                fields.sort()
-                            for rating_field in ('old_rating', 'rating_change', 'new_rating'):
-                                if rating_field in fields_set:
-                                    fields.remove(rating_field)
-                                    fields.append(rating_field)
+                                    if not no_update_account_time and not skip_result:
+                                        stats = (statistics_by_key or {}).get(member, {})
+                                        no_rating = (
+                                            with_stats and 'new_rating' not in stats and 'rating_change' not in stats
+                                        )
 
-                            if statistics_ids:
-                                first = Statistics.objects.filter(pk__in=statistics_ids).first()
-                                if first:
-                                    self.logger.info(f'First deleted: {first}, account = {first.account}')
-                                delete_info = Statistics.objects.filter(pk__in=statistics_ids).delete()
-                                self.logger.info(f'Delete info: {delete_info}')
-                                progress_bar.set_postfix(deleted=str(delete_info))
+                                        updated = now + timedelta(**updated_delta)
+
+                                        if no_rating and wait_rating and has_statistics:
+                                            updated = now + timedelta(hours=1)
+                                            title_re = wait_rating.get('title_re')
+                                            if (
+                                                (
+                                                    contest.end_time + timedelta(days=wait_rating['days']) > now
+                                                    or update_without_new_rating
+                                                )
+                                                and (not title_re or re.search(title_re, contest.title))
+                                                and updated < account.updated
+                                            ):
+                                                division = r.get('division')
+                                                if division not in user_info_has_rating:
+                                                    generator = plugin.get_users_infos(
+                                                        [member], contest.resource, [account],
+                                                    )
+                                                    try:
+                                                        user_info = next(generator)
+                                                        params = user_info.get('contest_addition_update_params', {})
+                                                        field = user_info.get('contest_addition_update_by') or params.get('by') or 'key'  # noqa
+                                                        updates = user_info.get('contest_addition_update') or params.get('update') or {}  # noqa
+                                                        if not isinstance(field, (list, tuple)):
+                                                            field = [field]
+                                                        user_info_has_rating[division] = False
+                                                        for f in field:
+                                                            if getattr(contest, f) in updates:
+                                                                user_info_has_rating[division] = True
+                                                                break
+                                                    except Exception:
+                                                        self.logger.error(format_exc())
+                                                        user_info_has_rating[division] = False
+
+                                                if user_info_has_rating[division]:
+                                                    n_upd_account_time += 1
+                                                    account.updated = updated
+                                                    accounts_updates[member].add('updated')
+                                        elif (
+                                            created
+                                            or (not has_statistics and updated < account.updated)
+                                            or (update_without_new_rating and updated < account.updated and no_rating)
+                                        ):
+                                            n_upd_account_time += 1
+                                            account.updated = updated
+                                            accounts_updates[member].add('updated')
+
+                                    if push_name_instead_key:
+                                        r['_name_instead_key'] = True
+                                    if push_name_instead_key_to_account:
+                                        account.info['_name_instead_key'] = True
+                                        accounts_updates[member].add('info')
+
+                                    no_update_name = r.pop('_no_update_name', False)
+                                    field_update_name = r.pop('_field_update_name', 'name')
+                                    if r.get(field_update_name):
+                                        r[field_update_name] = canonize_name(r[field_update_name])
+                                        if (
+                                            not no_update_name and
+                                            account.name != r[field_update_name]
+                                        ):
+                                            account.name = r[field_update_name]
+                                            accounts_updates[member].add('name')
+
+                                    country = r.get('country', None)
+                                    if country:
+                                        country = countrier.get(country)
+                                        if country and country != account.country:
+                                            account.country = country
+                                            accounts_updates[member].add('country')
+
+                                    contest_addition_update = r.pop('contest_addition_update', {})
+                                    if contest_addition_update:
+                                        account_update_contest_additions(
+                                            account,
+                                            contest_addition_update,
+                                            timedelta(days=31) if with_check else None
+                                        )
 
-                            if canonize(fields) != canonize(contest.info.get('fields')):
-                                contest.info['fields'] = fields
+                                    account_info = r.pop('info', {})
+                                    if account_info:
+                                        if 'rating' in account_info:
+                                            account_info['rating_ts'] = int(now.timestamp())
+                                        account.info.update(account_info)
+                                        accounts_updates[member].add('info')
+
+                                    if default_division and 'division' not in r:
+                                        r['division'] = default_division
+
+                                    problems = r.get('problems', {})
+
+                                    _languages = set()
+                                    for problem in problems.values():
+                                        if problem.get('language'):
+                                            languages.add(problem['language'])
+                                            _languages.add(problem['language'])
+                                    if '_languages' not in r and _languages:
+                                        r['_languages'] = list(sorted(_languages))
+
+                                    if ('team_id' not in r or r['team_id'] not in teams_viewed) and not skip_result:
+                                        if 'team_id' in r:
+                                            teams_viewed.add(r['team_id'])
+                                        solved = {'solving': 0}
+                                        if r.get('division'):
+                                            n_statistics[r.get('division')] += 1
+                                        n_statistics['__total__'] += 1
+                                        for k, v in problems.items():
+                                            if 'result' not in v:
+                                                continue
+
+                                            path = (r['division'], k) if with_division_problems else (k, )
+
+                                            scored = str(v['result']).startswith('+')
+                                            try:
+                                                scored = scored or float(v['result']) > 0
+                                            except Exception:
+                                                pass
+
+                                            if default_full_score:
+                                                if (
+                                                    'partial' not in v
+                                                    and default_full_score - float(v['result']) > 1e-9
+                                                ):
+                                                    v['partial'] = True
+                                                if not v.get('partial'):
+                                                    solved['solving'] += 1
+                                            ac = scored and not v.get('partial', False)
+
+                                            if with_last_submit_time and scored:
+                                                if '_last_submit_time' not in r or r['_last_submit_time'] < v['time']:
+                                                    r['_last_submit_time'] = v['time']
+                                            if without_problem_first_ac:
+                                                v.pop('first_ac', None)
+                                                v.pop('first_ac_of_all', None)
+                                            if without_problem_time:
+                                                v.pop('time', None)
+
+                                            if r.get('_skip_for_problem_stat'):
+                                                status = ProblemsStatistics.SKIPPED
+                                            elif ac:
+                                                status = ProblemsStatistics.ACCEPTED
+                                            elif scored and v.get('partial'):
+                                                status = ProblemsStatistics.PARTIAL
+                                            elif str(v['result']).startswith('?'):
+                                                status = ProblemsStatistics.HIDDEN
+                                            else:
+                                                status = ProblemsStatistics.SUBMITTED
+                                            problems_statistics.add(path, status)
+
+                                        if with_solved and solved and 'solved' not in r:
+                                            r['solved'] = solved
+
+                                    if advance:
+                                        k = 'advanced'
+                                        r.pop(k, None)
+                                        for cond in advance['filter']:
+                                            field = cond['field']
+                                            value = r.get(field)
+                                            value = get_number_from_str(value)
+                                            if value is None:
+                                                continue
+                                            r[k] = getattr(operator, cond['operator'])(value, cond['threshold'])
+
+                                    if medals:
+                                        k = 'medal'
+                                        r.pop(k, None)
+                                        if 'place' in r:
+                                            place = get_number_from_str(r['place'])
+                                            if member in medals_skip_members:
+                                                medals_skip.add(member)
+                                            elif place:
+                                                place -= len(medals_skip)
+                                                for medal in medals:
+                                                    if place <= medal['count']:
+                                                        r[k] = medal['name']
+                                                        if 'field' in medal:
+                                                            r[medal['field']] = medal['value']
+                                                            r[f'_{k}_title_field'] = medal['field']
+                                                        break
+                                                    place -= medal['count']
+                                        for f in medal_fields:
+                                            if f not in fields_set:
+                                                fields_set.add(f)
+                                                fields.append(f)
+
+                                    defaults = {
+                                        'place': r.pop('place', None),
+                                        'solving': r.pop('solving', 0),
+                                        'upsolving': r.pop('upsolving', 0),
+                                    }
+                                    defaults = {k: v for k, v in defaults.items() if v != '__unchanged__'}
 
-                            hidden_fields = [f for f in standings_hidden_fields if f in hidden_fields]
-                            if hidden_fields and canonize(hidden_fields) != canonize(contest.info.get('hidden_fields')):
-                                contest.info['hidden_fields'] = hidden_fields
+                                    addition = type(r)()
+                                    addition_was_ordereddict |= isinstance(addition, OrderedDict)
+                                    for k, v in r.items():
+                                        is_hidden_field = k in standings_hidden_fields_set
+                                        k = normalize_field(k)
 
-                            fields_types = {k: list(v) for k, v in fields_types.items()}
-                            for k, v in standings.get('fields_types', {}).items():
-                                fields_types.setdefault(k, []).extend(v)
-                            contest.info['fields_types'] = fields_types
+                                        if is_hidden_field:
+                                            hidden_fields.add(k)
+                                        if k not in fields_set:
+                                            fields_set.add(k)
+                                            fields.append(k)
 
-                            if calculate_time and not contest.calculate_time:
-                                contest.calculate_time = True
+                                        if (k in Resource.RATING_FIELDS or k == 'rating_change') and v is None:
+                                            continue
 
-                            contest.n_statistics = n_statistics.pop('__total__', 0)
+                                        fields_types.setdefault(k, set()).add(type(v).__name__)
+                                        addition[k] = v
 
-                            problems = standings.pop('problems', None)
-                            if problems is not None:
-                                if 'division' in problems:
-                                    for d, ps in problems['division'].items():
-                                        for p in ps:
+                                    if (
+                                        addition.get('rating_change') is None
+                                        and addition.get('new_rating') is not None
+                                        and addition.get('old_rating') is not None
+                                    ):
+                                        delta = addition['new_rating'] - addition['old_rating']
+                                        f = 'rating_change'
+                                        addition[f] = f'{"+" if delta > 0 else ""}{delta}'
+                                        if f not in fields_set:
+                                            fields_set.add(f)
+                                            fields.append(f)
+
+                                    if 'is_rated' in addition and not addition['is_rated']:
+                                        addition.pop('old_rating', None)
+
+                                    if 'new_rating' in addition and (
+                                        'rating_ts' not in account.info or account.info['rating_ts'] <= rating_ts
+                                    ):
+                                        account.info['rating_ts'] = rating_ts
+                                        account.info['rating'] = addition['new_rating']
+                                        accounts_updates[member].add('info')
+
+                                    stored = (stored_statistics or {}).get(account.pk)
+                                    if calc_time and stored:
+                                        p_problems = stored[2].get('problems', {})
+
+                                        for k, v in problems.items():
+                                            v_result = v.get('result', '')
+                                            if isinstance(v_result, str) and '?' in v_result:
+                                                calculate_time = True
+                                            p = p_problems.get(k, {})
+                                            if 'time' in v:
+                                                continue
+                                            has_change = v.get('result') != p.get('result')
+                                            if (not has_change or contest.end_time < now) and 'time' in p:
+                                                v['time'] = p['time']
+                                            else:
+                                                v['time'] = calc_time_value
+
+                                    for p in problems.values():
+                                        p_result = p.get('result', '')
+                                        if isinstance(p_result, str) and '?' in p_result:
+                                            has_hidden = True
+
+                                    defaults['addition'] = addition
+                                    fingerprint = Statistics.get_fingerprint(defaults)
+                                    if fingerprint is not None and stored and fingerprint == stored[1]:
+                                        statistics_ids.discard(stored[0])
+                                        upsert_statistics.pop(account.pk, None)
+                                        n_skipped_statistics += 1
+                                        profiler.count('skipped_statistics')
+                                        continue
+
+                                    if 'place' in defaults:
+                                        defaults['place_as_int'] = get_number_from_str(defaults['place'])
+                                    defaults['fingerprint'] = fingerprint
+                                    statistic = Statistics(account=account, contest=contest, **defaults)
+                                    upsert_statistics[account.pk] = (statistic, tuple(defaults.keys()))
+
+                                profiler.phase('write')
+                                Account.objects.bulk_save(
+                                    [accounts[member] for member in accounts_updates],
+                                    fields=set.union(set(), *accounts_updates.values()),
+                                )
+
+                                statistics_by_fields = defaultdict(list)
+                                for statistic, update_fields in upsert_statistics.values():
+                                    statistics_by_fields[update_fields].append(statistic)
+                                n_written_statistics += len(upsert_statistics)
+                                profiler.count('written_statistics', len(upsert_statistics))
+                                progress_bar.set_postfix(written=len(upsert_statistics))
+                                for update_fields, group in statistics_by_fields.items():
+                                    upserted = Statistics.objects.bulk_upsert(
+                                        group,
+                                        unique_fields=('account', 'contest'),
+                                        update_fields=update_fields,
+                                        returning=('id', 'account'),
+                                    )
+                                    for pk, account_id, created in upserted:
+                                        statistics_ids.discard(pk)
+                                        if created:
+                                            deferred_counters.add_accounts([account_id])
+                                n_contest_written_statistics += len(upsert_statistics)
+                                profiler.phase('get_standings')
+
+                            profiler.phase('contest')
+                            if users is None:
+                                timing_statistic_delta = standings.get(
+                                    'timing_statistic_delta',
+                                    timedelta(minutes=30) if has_hidden and contest.end_time < now else None,
+                                )
+                                if timing_statistic_delta is not None:
+                                    contest.timing.statistic = timezone.now() + timing_statistic_delta
+                                    contest.timing.save()
+
+                                if contest.start_time <= now:
+                                    if now < contest.end_time:
+                                        contest.info['last_parse_statistics'] = now.strftime('%Y-%m-%d %H:%M:%S.%f+%Z')
+                                    elif 'last_parse_statistics' in contest.info:
+                                        contest.info.pop('last_parse_statistics')
+
+                                if fields_set and not addition_was_ordereddict:
+                                    fields.sort()
+                                for rating_field in ('old_rating', 'rating_change', 'new_rating'):
+                                    if rating_field in fields_set:
+                                        fields.remove(rating_field)
+                                        fields.append(rating_field)
+
+                                standings_changed = bool(n_contest_written_statistics or statistics_ids)
+                                if statistics_ids:
+                                    first = Statistics.objects.filter(pk__in=statistics_ids).first()
+                                    if first:
+                                        self.logger.info(f'First deleted: {first}, account = {first.account}')
+                                    delete_info = Statistics.objects.filter(pk__in=statistics_ids).delete()
+                                    self.logger.info(f'Delete info: {delete_info}')
+                                    progress_bar.set_postfix(deleted=str(delete_info))
+
+                                if canonize(fields) != canonize(contest.info.get('fields')):
+                                    contest.info['fields'] = fields
+
+                                hidden_fields = [f for f in standings_hidden_fields if f in hidden_fields]
+                                contest_hidden_fields = contest.info.get('hidden_fields')
+                                if hidden_fields and canonize(hidden_fields) != canonize(contest_hidden_fields):
+                                    contest.info['hidden_fields'] = hidden_fields
+
+                                fields_types = {k: list(v) for k, v in fields_types.items()}
+                                for k, v in standings.get('fields_types', {}).items():
+                                    fields_types.setdefault(k, []).extend(v)
+                                contest.info['fields_types'] = fields_types
+
+                                if calculate_time and not contest.calculate_time:
+                                    contest.calculate_time = True
+
+                                contest.n_statistics = n_statistics.pop('__total__', 0)
+
+                                problems = standings.pop('problems', None)
+                                if problems is not None:
+                                    d_problems = problems_statistics.aggregate(full_score=default_full_score)
+                                    if 'division' in problems:
+                                        for d, ps in problems['division'].items():
+                                            for p in ps:
+                                                k = get_problem_short(p)
+                                                if k:
+                                                    p.update(d_problems.get(d, {}).get(k, {}))
+                                                    p['n_total'] = n_statistics[d]
+                                        if isinstance(problems['division'], OrderedDict):
+                                            problems['divisions_order'] = list(problems['division'].keys())
+                                        problems['n_statistics'] = n_statistics
+                                    else:
+                                        for p in problems:
                                             k = get_problem_short(p)
                                             if k:
-                                                p.update(d_problems.get(d, {}).get(k, {}))
-                                                p['n_total'] = n_statistics[d]
-                                    if isinstance(problems['division'], OrderedDict):
-                                        problems['divisions_order'] = list(problems['division'].keys())
-                                    problems['n_statistics'] = n_statistics
-                                else:
-                                    for p in problems:
-                                        k = get_problem_short(p)
-                                        if k:
-                                            p.update(d_problems.get(k, {}))
-                                            p['n_total'] = contest.n_statistics
+                                                p.update(d_problems.get(k, {}))
+                                                p['n_total'] = contest.n_statistics
 
-                                update_problems(contest, problems=problems, force=force_problems)
+                                    profiler.phase('problems')
+                                    update_problems(contest, problems=problems, force=force_problems)
+                                    profiler.phase('contest')
 
-                            if languages:
-                                languages = list(sorted(languages))
-                                if canonize(languages) != canonize(contest.info.get('languages')):
-                                    contest.info['languages'] = languages
+                                if languages:
+                                    languages = list(sorted(languages))
+                                    if canonize(languages) != canonize(contest.info.get('languages')):
+                                        contest.info['languages'] = languages
 
-                            contest.save()
+                                contest.save()
+
+                                if standings_hash is not None:
+                                    contest.timing.standings_fingerprint = Statistics.get_fingerprint(
+                                        standings_hash, contest.info, resource.info,
+                                    )
+                                if contest.end_time < now and timing_statistic_delta is None:
+                                    contest.timing.update_statistic_backoff(
+                                        changed=standings_changed,
+                                        min_delay=resource.module.min_delay_on_unchanged,
+                                        max_delay=resource.module.max_delay_on_unchanged,
+                                    )
+                                contest.timing.save()
 
-                            progress_bar.set_postfix(n_fields=len(fields))
+                                progress_bar.set_postfix(n_fields=len(fields))
+                        else:
+                            problems = standings.pop('problems', None)
+                            if problems is not None and problems:
+                                problems = plugin.merge_dict(problems, contest.info.get('problems'))
+                                if not users:
+                                    contest.info['problems'] = {}
+                                profiler.phase('problems')
+                                update_problems(contest, problems=problems, force=force_problems)
+
+                        action = standings.get('action')
+                        if action is not None:
+                            args = []
+                            if isinstance(action, tuple):
+                                action, *args = action
+                            self.logger.info(f'Action {action} with {args}, contest = {contest}, url = {contest.url}')
+                            if action == 'delete':
+                                force = standings.get('force')
+                                if not force and Statistics.objects.filter(contest=contest).exists():
+                                    self.logger.info('No deleted. Contest have statistics')
+                                elif not force and now < contest.end_time:
+                                    self.logger.info(f'No deleted. Try after = {contest.end_time - now}')
+                                else:
+                                    delete_info = contest.delete()
+                                    self.logger.info(f'Delete info contest: {delete_info}')
+                            elif action == 'url':
+                                contest.url = args[0]
+                                contest.save()
+                    if 'result' in standings:
+                        count += 1
+                    parsed = True
+                except (ExceptionParseStandings, InitModuleException) as e:
+                    progress_bar.set_postfix(exception=str(e), cid=str(contest.pk))
+                except Exception as e:
+                    self.logger.error(f'contest = {contest.pk}, error = {e}, row = {r}')
+                    self.logger.error(format_exc())
+                    if stop_on_error:
+                        break
+                finally:
+                    leases.pop(contest.pk, None)
+                    contest.timing.release_lease(lease_owner)
+                    profiler.finish(parsed=parsed)
+                if not parsed:
+                    if now < contest.end_time and contest.duration_in_secs <= limit_duration_in_secs:
+                        delay = timedelta(minutes=0)
                     else:
-                        problems = standings.pop('problems', None)
-                        if problems is not None and problems:
-                            problems = plugin.merge_dict(problems, contest.info.get('problems'))
-                            if not users:
-                                contest.info['problems'] = {}
-                            update_problems(contest, problems=problems, force=force_problems)
-
-                    action = standings.get('action')
-                    if action is not None:
-                        args = []
-                        if isinstance(action, tuple):
-                            action, *args = action
-                        self.logger.info(f'Action {action} with {args}, contest = {contest}, url = {contest.url}')
-                        if action == 'delete':
-                            force = standings.get('force')
-                            if not force and Statistics.objects.filter(contest=contest).exists():
-                                self.logger.info('No deleted. Contest have statistics')
-                            elif not force and now < contest.end_time:
-                                self.logger.info(f'No deleted. Try after = {contest.end_time - now}')
-                            else:
-                                delete_info = contest.delete()
-                                self.logger.info(f'Delete info contest: {delete_info}')
-                        elif action == 'url':
-                            contest.url = args[0]
-                            contest.save()
-                if 'result' in standings:
-                    count += 1
-                parsed = True
-            except (ExceptionParseStandings, InitModuleException) as e:
-                progress_bar.set_postfix(exception=str(e), cid=str(contest.pk))
-            except Exception as e:
-                self.logger.error(f'contest = {contest.pk}, error = {e}, row = {r}')
-                self.logger.error(format_exc())
-                if stop_on_error:
-                    break
-            if not parsed:
-                if now < c.end_time and c.duration_in_secs <= limit_duration_in_secs:
-                    delay = timedelta(minutes=0)
-                else:
-                    delay = resource.module.delay_on_error
-                contest.timing.statistic = timezone.now() + delay
-                contest.timing.save()
-            elif not no_update_results and (users is None or users):
-                stages = Stage.objects.filter(
-                    ~Q(pk__in=stages_ids),
-                    contest__start_time__lte=contest.start_time,
-                    contest__end_time__gte=contest.end_time,
-                    contest__resource=contest.resource,
-                )
-                for stage in stages:
-                    if Contest.objects.filter(pk=contest.pk, **stage.filter_params).exists():
-                        stages_ids.append(stage.pk)
-
-        for stage in tqdm(Stage.objects.filter(pk__in=stages_ids),
-                          total=len(stages_ids),
-                          desc='getting stages'):
-            stage.update()
+                        delay = resource.module.delay_on_error
+                    contest.timing.statistic = timezone.now() + delay
+                    contest.timing.save(update_fields=['statistic', 'modified'])
+                elif not no_update_results and (users is None or users):
+                    stages = Stage.objects.filter(
+                        ~Q(pk__in=stages_ids),
+                        contest__start_time__lte=contest.start_time,
+                        contest__end_time__gte=contest.end_time,
+                        contest__resource=contest.resource,
+                    )
+                    for stage in stages:
+                        if Contest.objects.filter(pk=contest.pk, **stage.filter_params).exists():
+                            stages_ids.append(stage.pk)
+
+            with profiler.span('stages'):
+                for stage in tqdm(Stage.objects.filter(pk__in=stages_ids),
+                                  total=len(stages_ids),
+                                  desc='getting stages'):
+                    stage.update(statistics_cache=stages_statistics_cache)
 
         progress_bar.close()
-        self.logger.info(f'Parsed statistic: {count} of {total}. Updated account time: {n_upd_account_time}')
+        self.logger.info(f'Parsed statistic: {count} of {total}. Updated account time: {n_upd_account_time}. '
+                         f'Written statistics: {n_written_statistics}, skipped unchanged: {n_skipped_statistics}. '
+                         f'Unchanged standings: {n_unchanged_standings}')
+        return count, total
+
+    @staticmethod
+    def get_timing_statistic(contest):
+        return contest.timing.statistic if hasattr(contest, 'timing') else None
+
+    @staticmethod
+    def claim_contest(contest, statistic, owner, limit_duration_in_secs):
+        """
+        Lease contest and reschedule its statistic time in one transaction, return leased timing.
+        Contest leased by another process or parsed after statistic time was seen by caller is skipped.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            if not hasattr(contest, 'timing'):
+                TimingContest.objects.bulk_create([TimingContest(contest=contest)], ignore_conflicts=True)
+            timings = TimingContest.acquire_leases({contest.pk: statistic}, owner=owner, now=now)
+            if not timings:
+                return None
+            timing = timings[0]
+            module = contest.resource.module
+            delay_on_success = module.delay_on_success or module.max_delay_after_end
+            if now < contest.end_time:
+                if contest.end_time - contest.start_time <= timedelta(seconds=limit_duration_in_secs):
+                    delay_on_success = timedelta(minutes=0)
+                elif contest.end_time < now + delay_on_success:
+                    delay_on_success = contest.end_time - now + timedelta(seconds=5)
+            timing.statistic = now + delay_on_success
+            timing.save(update_fields=['statistic', 'lease_owner', 'lease_expires', 'modified'])
+        return timing
+
+    def parse_statistic_by_workers(self, contests, workers, **kwargs):
+        # statistic time seen here is passed to workers to skip contests parsed by others after selection
+        contests_statistics = defaultdict(dict)
+        for contest in contests:
+            contests_statistics[contest.resource_id][contest.pk] = self.get_timing_statistic(contest)
+        groups = sorted(contests_statistics.values(), key=len, reverse=True)
+        count, total = run_by_workers(parse_statistic_worker, groups, kwargs, workers, self.logger)
+        self.logger.info(f'Parsed statistic by {workers} workers: {count} of {total}')
         return count, total
 
     def handle(self, *args, **options):
@@ -743,4 +1098,6 @@ class Command(BaseCommand):
             with_stats=not args.no_stats,
             update_without_new_rating=args.update_without_new_rating,
             force_problems=args.force_problems,
+            force_standings=args.force_standings,
+            workers=args.workers,
         )
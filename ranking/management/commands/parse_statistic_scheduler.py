@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from logging import getLogger
+
+from attrdict import AttrDict
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from traceback_with_variables import format_exc
+
+from clist.models import Contest
+from ranking.management.commands.common import add_workers_argument, create_workers_executor
+from ranking.management.commands.parse_statistic import parse_statistic_worker
+from ranking.models import Statistics
+
+
+class Command(BaseCommand):
+    help = 'Scheduler of parsing statistics by timing'
+
+    def __init__(self, *args, **kw):
+        super(Command, self).__init__(*args, **kw)
+        self.logger = getLogger('ranking.parse.statistic.scheduler')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--resources', metavar='HOST', nargs='*', help='host name for update')
+        add_workers_argument(parser)
+        parser.add_argument('--poll-interval', type=int, default=10, help='seconds between polls of changes')
+        parser.add_argument('--refresh-interval', type=int, default=30 * 60, help='seconds between full rescans')
+        parser.add_argument('--batch-size', type=int, default=20, help='max contests to dispatch at once')
+        parser.add_argument('--no-stats', action='store_true', default=False, help='Do not pass statistics to module')
+
+    def get_contests(self, now, lookahead):
+        contests = Contest.objects.filter(resource__module__isnull=False)
+        if self.resources:
+            contests = contests.filter(resource__host__iregex='|'.join(self.resources))
+        contests = contests.filter(start_time__lt=now + lookahead)
+        contests = contests.annotate(has_statistics=Exists(Statistics.objects.filter(contest_id=OuterRef('pk'))))
+        return contests
+
+    def get_due_time(self, contest, now):
+        statistic = contest['timing__statistic']
+        start_time = contest['start_time']
+        end_time = contest['end_time']
+        if contest['has_statistics'] and start_time < now < end_time:
+            due = statistic or now
+            if due < end_time:
+                return due
+        # same conditions as for ended contests in parse_statistic
+        ready = end_time + contest['resource__module__min_delay_after_end']
+        due = max(ready, statistic) if statistic else ready
+        if statistic and due > end_time + contest['resource__module__max_delay_after_end']:
+            return
+        return due
+
+    def schedule(self, contests, now, not_before=None):
+        values = contests.values(
+            'pk',
+            'resource_id',
+            'start_time',
+            'end_time',
+            'has_statistics',
+            'timing__statistic',
+            'resource__module__min_delay_after_end',
+            'resource__module__max_delay_after_end',
+        )
+        n_scheduled = 0
+        for contest in values:
+            due = self.get_due_time(contest, now)
+            if due is None:
+                self.scheduled.pop(contest['pk'], None)
+                continue
+            self.contests_infos[contest['pk']] = (contest['resource_id'], contest['timing__statistic'])
+            if not_before and due < not_before:
+                due = not_before
+            if self.scheduled.get(contest['pk']) == due:
+                continue
+            self.scheduled[contest['pk']] = due
+            heapq.heappush(self.queue, (due, contest['pk']))
+            n_scheduled += 1
+        return n_scheduled
+
+    def refresh(self, now):
+        self.queue = []
+        self.scheduled = {}
+        self.contests_infos = {}
+        contests = self.get_contests(now, self.refresh_interval)
+        contests = contests.filter(
+            Q(end_time__gt=now - F('resource__module__max_delay_after_end'))
+            | Q(timing__statistic__isnull=True)
+        )
+        n_scheduled = self.schedule(contests, now)
+        self.logger.info(f'Refreshed queue: {n_scheduled} contests')
+
+    def poll(self, now, since):
+        contests = self.get_contests(now, self.refresh_interval)
+        contests = contests.filter(Q(modified__gte=since) | Q(timing__modified__gte=since))
+        n_scheduled = self.schedule(contests, now)
+        if n_scheduled:
+            self.logger.info(f'Polled changes: {n_scheduled} contests')
+
+    def pop_due(self, now):
+        """
+        Return due contests ids grouped by free resources up to free workers, contests of busy resources are kept.
+        """
+        groups = defaultdict(list)
+        busy_resources = {resource_id for resource_id, _ in self.running.values()}
+        n_free_workers = self.workers - len(self.running)
+        kept = []
+        while self.queue:
+            due, pk = self.queue[0]
+            if self.scheduled.get(pk) != due:
+                heapq.heappop(self.queue)
+                continue
+            if due > now:
+                break
+            heapq.heappop(self.queue)
+            resource_id = self.contests_infos[pk][0]
+            group = groups.get(resource_id)
+            if (
+                resource_id in busy_resources
+                or group is None and len(groups) >= n_free_workers
+                or group is not None and len(group) >= self.batch_size
+            ):
+                kept.append((due, pk))
+                continue
+            self.scheduled.pop(pk)
+            groups[resource_id].append(pk)
+        for item in kept:
+            heapq.heappush(self.queue, item)
+        self.n_kept = len(kept)
+        return groups
+
+    def dispatch(self, resource_id, contests_ids):
+        contests_statistics = {pk: self.contests_infos[pk][1] for pk in contests_ids}
+        kwargs = {'with_stats': self.with_stats}
+        # worker processes are forked on submit and must not share db connection with scheduler
+        connections.close_all()
+        try:
+            future = self.executor.submit(parse_statistic_worker, contests_statistics, kwargs)
+        except BrokenProcessPool:
+            self.logger.error(format_exc())
+            self.executor = create_workers_executor(self.workers)
+            future = self.executor.submit(parse_statistic_worker, contests_statistics, kwargs)
+        self.running[future] = (resource_id, contests_ids)
+
+    def collect_finished(self):
+        contests_ids = []
+        for future in [f for f in self.running if f.done()]:
+            _, ids = self.running.pop(future)
+            contests_ids.extend(ids)
+            try:
+                future.result()
+            except Exception:
+                self.logger.error(format_exc())
+        if not contests_ids:
+            return
+        # contest leased by another process or not rescheduled by parsing should not be dispatched in a loop
+        now = timezone.now()
+        contests = self.get_contests(now, self.refresh_interval).filter(pk__in=contests_ids)
+        self.schedule(contests, now, not_before=now + self.poll_interval)
+
+    def handle(self, *args, **options):
+        self.stdout.write(str(options))
+        args = AttrDict(options)
+
+        self.resources = args.resources
+        self.workers = args.workers or 1
+        self.with_stats = not args.no_stats
+        self.batch_size = args.batch_size
+        self.refresh_interval = timedelta(seconds=args.refresh_interval)
+        self.poll_interval = timedelta(seconds=args.poll_interval)
+        self.queue = []
+        self.scheduled = {}
+        self.contests_infos = {}
+        self.running = {}
+        self.n_kept = 0
+        self.executor = create_workers_executor(self.workers)
+
+        next_refresh = timezone.now()
+        last_poll = next_refresh
+        while True:
+            try:
+                close_old_connections()
+                now = timezone.now()
+                if now >= next_refresh:
+                    self.refresh(now)
+                    next_refresh = now + self.refresh_interval
+                    last_poll = now
+                elif now >= last_poll + self.poll_interval:
+                    self.poll(now, last_poll)
+                    last_poll = now
+
+                self.collect_finished()
+                for resource_id, contests_ids in self.pop_due(now).items():
+                    self.dispatch(resource_id, contests_ids)
+            except Exception:
+                self.logger.error(format_exc())
+                time.sleep(self.poll_interval.total_seconds())
+                continue
+
+            wakeup = min(last_poll + self.poll_interval, next_refresh)
+            # kept due contests wait for finish of running parsing
+            if self.queue and not self.n_kept:
+                wakeup = min(wakeup, self.queue[0][0])
+            delay = max((wakeup - timezone.now()).total_seconds(), 0)
+            if self.running:
+                wait(self.running, timeout=delay, return_when=FIRST_COMPLETED)
+            elif delay > 0:
+                time.sleep(delay)
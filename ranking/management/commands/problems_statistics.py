@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from array import array
+
+import numpy as np
+
+
+class ProblemsStatistics:
+    """
+    Column-wise collector of problems results, counters are computed by numpy on aggregate.
+    """
+
+    SKIPPED = -1
+    SUBMITTED = 0
+    ACCEPTED = 1
+    PARTIAL = 2
+    HIDDEN = 3
+
+    COUNTERS = (
+        ('n_accepted', ACCEPTED),
+        ('n_partial', PARTIAL),
+        ('n_hidden', HIDDEN),
+    )
+
+    def __init__(self):
+        self.paths = {}
+        self.indices = array('q')
+        self.statuses = array('b')
+
+    def add(self, path, status):
+        index = self.paths.setdefault(path, len(self.paths))
+        self.indices.append(index)
+        self.statuses.append(status)
+
+    def aggregate(self, full_score=None):
+        n_paths = len(self.paths)
+        indices = np.frombuffer(self.indices, dtype=np.int64)
+        statuses = np.frombuffer(self.statuses, dtype=np.int8)
+
+        counters = {'n_teams': np.bincount(indices[statuses != self.SKIPPED], minlength=n_paths)}
+        for name, status in self.COUNTERS:
+            counters[name] = np.bincount(indices[statuses == status], minlength=n_paths)
+
+        ret = {}
+        for path, index in self.paths.items():
+            problem = ret
+            for key in path:
+                problem = problem.setdefault(key, {})
+            if full_score:
+                problem['full_score'] = full_score
+            for name, values in counters.items():
+                if values[index]:
+                    problem[name] = int(values[index])
+        return ret
@@ -28,7 +28,6 @@ def _query(
     method,
     params,
     api_key=DEFAULT_API_KEY,
-    prev_time_queries={},
     api_url_format='https://codeforces.com/api/%s'
 ):
     url = api_url_format % method
@@ -53,21 +52,16 @@ def _query(
     params['apiSig'] = api_sig_prefix + sha512(api_sig.encode('utf8')).hexdigest()
     url += '?' + urlencode(params)
 
-    times = prev_time_queries.setdefault((key, secret), [])
-    if len(times) == 5:
-        delta = max(4 - (time() - times[0]), 0)
-        sleep(delta)
-        times.clear()
+    rate_limit_key = f'codeforces:{key}'
+    REQ.rate_limiter.configure(rate_limit_key, rate=5 / 4, burst=5)
 
     md5_file_cache = url
     for k in ('apiSig', 'time', ):
         md5_file_cache = re.sub('%s=[0-9a-z]+' % k, '', md5_file_cache)
-    times.append(time())
 
     for attempt in reversed(range(5)):
         try:
-            page = REQ.get(url, md5_file_cache=md5_file_cache)
-            times[-1] = time()
+            page = REQ.get(url, md5_file_cache=md5_file_cache, rate_limit_key=rate_limit_key)
             ret = json.loads(page)
         except FailOnGetResponse as e:
             if e.code == 503 and attempt:
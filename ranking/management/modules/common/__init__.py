@@ -54,11 +54,33 @@ class BaseModule(object, metaclass=ABCMeta):
             )
         for k, v in kwargs.items():
             setattr(self, k, v)
+        resource = kwargs.get('resource')
+        if resource is not None:
+            self.configure_rate_limits(resource)
+
+    @staticmethod
+    def configure_rate_limits(resource):
+        requester.rate_limiter.configure_hosts(resource.info.get('rate_limits', {}))
 
     @abstractmethod
     def get_standings(self, users=None):
         pass
 
+    def get_standings_chunks(self, users=None, statistics=None):
+        """
+        Generator of standings parts. First part is standings with all known fields and optional result,
+        next parts are chunks of result, other fields of parts (problems, fields_types, ...) are merged into standings.
+        Contest fields (url, title, options, info_fields and its values, writers, problems_time_format and
+        problems with divisions) must come with the first part, hidden_fields are applied from its part.
+        Statistics is lazy mapping by key, statistics.prefetch(keys) loads additions of next rows by one query.
+        Override to parse big standings with bounded memory.
+        """
+        yield self.get_standings(users=users, statistics=statistics)
+
+    @property
+    def has_standings_chunks(self):
+        return type(self).get_standings_chunks is not BaseModule.get_standings_chunks
+
     @staticmethod
     def get_users_infos(users, resource=None, accounts=None, pbar=None):
         raise NotImplementedError()
@@ -24,6 +24,7 @@ class Statistic(BaseModule):
     RANKING_URL_FORMAT_ = '{url}/ranking'
     API_SUBMISSION_URL_FORMAT_ = 'https://leetcode{}.com/api/submissions/{}/'
     STATE_FILE = os.path.join(os.path.dirname(__file__), '.leetcode.yaml')
+    STANDINGS_CHUNK_PAGES = 40
 
     def __init__(self, **kwargs):
         super(Statistic, self).__init__(**kwargs)
@@ -55,6 +56,14 @@ class Statistic(BaseModule):
         return submission, content
 
     def get_standings(self, users=None, statistics=None):
+        chunks = self.get_standings_chunks(users=users, statistics=statistics)
+        standings = next(chunks)
+        for chunk in chunks:
+            standings['result'].update(chunk['result'])
+            standings['hidden_fields'].extend(f for f in chunk['hidden_fields'] if f not in standings['hidden_fields'])
+        return standings
+
+    def get_standings_chunks(self, users=None, statistics=None):
         standings_url = self.standings_url or self.RANKING_URL_FORMAT_.format(**self.__dict__)
 
         api_ranking_url_format = self.API_RANKING_URL_FORMAT_.format(**self.__dict__)
@@ -62,7 +71,8 @@ class Statistic(BaseModule):
         content = Statistic._get(url)
         data = json.loads(content)
         if not data:
-            return {'result': {}, 'url': standings_url}
+            yield {'result': {}, 'url': standings_url}
+            return
         n_page = (data['user_num'] - 1) // len(data['total_rank']) + 1
 
         problems_info = OrderedDict((
@@ -116,119 +126,108 @@ class Statistic(BaseModule):
             content = REQ.get(url)
             return json.loads(content)
 
-        hidden_fields = set()
-        result = {}
+        standings = {
+            'result': {},
+            'url': standings_url,
+            'hidden_fields': [],
+            'problems': list(problems_info.values()),
+        }
+        if writers:
+            writers = [w[0] for w in sorted(writers.items(), key=lambda w: w[1], reverse=True)]
+            standings['writers'] = writers
+        yield standings
+
+        seen_handles = set()
         stop = False
-        timing_statistic_delta = None
         rank_index0 = False
         if users is None or users:
             if users:
                 users = list(users)
             start_time = self.start_time.replace(tzinfo=None)
-            with PoolExecutor(max_workers=8) as executor:
-                solutions_for_get = []
-
-                for data in tqdm.tqdm(
-                    executor.map(fetch_page, range(n_page)),
-                    total=n_page,
-                    desc='parsing statistics paging',
-                ):
+            pbar = tqdm.tqdm(total=n_page, desc='parsing statistics paging')
+            with PoolExecutor(max_workers=8) as executor, pbar:
+                # pages are fetched by chunks to not keep all standings in memory
+                for chunk_start in range(0, n_page, self.STANDINGS_CHUNK_PAGES):
                     if stop:
                         break
-                    n_added = 0
-                    for row, submissions in zip(data['total_rank'], data['submissions']):
-                        handle = row.pop('user_slug').lower()
-                        if users and handle not in users or handle in result:
-                            continue
-                        row.pop('contest_id')
-                        row.pop('global_ranking')
-
-                        r = result.setdefault(handle, OrderedDict())
-                        r['member'] = handle
-                        r['solving'] = row.pop('score')
-                        r['name'] = row.pop('username')
-
-                        rank = int(row.pop('rank'))
-                        rank_index0 |= rank == 0
-                        r['place'] = rank + (1 if rank_index0 else 0)
-
-                        data_region = row.pop('data_region').lower()
-                        r['info'] = {'profile_url': {'_data_region': '' if data_region == 'us' else f'-{data_region}'}}
-
-                        country = None
-                        for field in 'country_code', 'country_name':
-                            country = country or row.pop(field, None)
-                        if country:
-                            r['country'] = country
-
-                        problems_stats = (statistics or {}).get(handle, {}).get('problems', {})
-
-                        solved = 0
-                        problems = r.setdefault('problems', {})
-                        for i, (k, s) in enumerate(submissions.items(), start=1):
-                            short = problems_info[k]['short']
-                            p = problems.setdefault(short, problems_stats.get(short, {}))
-                            p['time'] = self.to_time(datetime.fromtimestamp(s['date']) - start_time)
-                            if s['status'] == 10:
-                                solved += 1
-                                p['result'] = '+' + str(s['fail_count'] or '')
-                            else:
-                                p['result'] = f'-{s["fail_count"]}'
-                            if 'submission_id' in s:
-                                p['submission_id'] = s['submission_id']
-                                p['external_solution'] = True
-                                p['data_region'] = s['data_region']
-                                if 'language' not in p:
-                                    s['handle'] = handle
-                                    solutions_for_get.append(s)
-
-                        if users:
-                            users.remove(handle)
-                            if not users:
-                                stop = True
-
-                        if not problems:
-                            result.pop(handle)
-                            continue
-
-                        r['solved'] = {'solving': solved}
-                        finish_time = datetime.fromtimestamp(row.pop('finish_time')) - start_time
-                        r['penalty'] = self.to_time(finish_time)
-                        r.update(row)
-                        hidden_fields |= set(row.keys())
-                        if statistics and handle in statistics:
-                            stat = statistics[handle]
-                            for k in ('rating_change', 'new_rating'):
-                                if k in stat:
-                                    r[k] = stat[k]
-                        n_added += 1
-                    if n_added == 0:
-                        stop = True
-
-                # if statistics is not None and solutions_for_get:
-                #     if statistics:
-                #         for s, d in tqdm.tqdm(executor.map(Statistic.fetch_submission, solutions_for_get),
-                #                               total=len(solutions_for_get),
-                #                               desc='getting solutions'):
-                #             if not d:
-                #                 continue
-                #             short = problems_info[str(s['question_id'])]['short']
-                #             result[s['handle']]['problems'][short].update({'language': d['lang']})
-                #     elif result:
-                #         timing_statistic_delta = timedelta(minutes=15)
-
-        standings = {
-            'result': result,
-            'url': standings_url,
-            'hidden_fields': hidden_fields,
-            'problems': list(problems_info.values()),
-        }
-        if writers:
-            writers = [w[0] for w in sorted(writers.items(), key=lambda w: w[1], reverse=True)]
-            standings['writers'] = writers
-        if timing_statistic_delta:
-            standings['timing_statistic_delta'] = timing_statistic_delta
-        return standings
+                    hidden_fields = set()
+                    result = {}
+                    chunk_pages = range(chunk_start, min(chunk_start + self.STANDINGS_CHUNK_PAGES, n_page))
+                    for data in executor.map(fetch_page, chunk_pages):
+                        pbar.update()
+                        if stop:
+                            break
+                        n_added = 0
+                        if hasattr(statistics, 'prefetch'):
+                            statistics.prefetch(row['user_slug'].lower() for row in data['total_rank'])
+                        for row, submissions in zip(data['total_rank'], data['submissions']):
+                            handle = row.pop('user_slug').lower()
+                            if users and handle not in users or handle in seen_handles:
+                                continue
+                            row.pop('contest_id')
+                            row.pop('global_ranking')
+
+                            r = result.setdefault(handle, OrderedDict())
+                            r['member'] = handle
+                            r['solving'] = row.pop('score')
+                            r['name'] = row.pop('username')
+
+                            rank = int(row.pop('rank'))
+                            rank_index0 |= rank == 0
+                            r['place'] = rank + (1 if rank_index0 else 0)
+
+                            data_region = row.pop('data_region').lower()
+                            data_region = '' if data_region == 'us' else f'-{data_region}'
+                            r['info'] = {'profile_url': {'_data_region': data_region}}
+
+                            country = None
+                            for field in 'country_code', 'country_name':
+                                country = country or row.pop(field, None)
+                            if country:
+                                r['country'] = country
+
+                            problems_stats = (statistics or {}).get(handle, {}).get('problems', {})
+
+                            solved = 0
+                            problems = r.setdefault('problems', {})
+                            for i, (k, s) in enumerate(submissions.items(), start=1):
+                                short = problems_info[k]['short']
+                                p = problems.setdefault(short, problems_stats.get(short, {}))
+                                p['time'] = self.to_time(datetime.fromtimestamp(s['date']) - start_time)
+                                if s['status'] == 10:
+                                    solved += 1
+                                    p['result'] = '+' + str(s['fail_count'] or '')
+                                else:
+                                    p['result'] = f'-{s["fail_count"]}'
+                                if 'submission_id' in s:
+                                    p['submission_id'] = s['submission_id']
+                                    p['external_solution'] = True
+                                    p['data_region'] = s['data_region']
+
+                            if users:
+                                users.remove(handle)
+                                if not users:
+                                    stop = True
+
+                            if not problems:
+                                result.pop(handle)
+                                continue
+
+                            r['solved'] = {'solving': solved}
+                            finish_time = datetime.fromtimestamp(row.pop('finish_time')) - start_time
+                            r['penalty'] = self.to_time(finish_time)
+                            r.update(row)
+                            hidden_fields |= set(row.keys())
+                            if statistics and handle in statistics:
+                                stat = statistics[handle]
+                                for k in ('rating_change', 'new_rating'):
+                                    if k in stat:
+                                        r[k] = stat[k]
+                            seen_handles.add(handle)
+                            n_added += 1
+                        if n_added == 0:
+                            stop = True
+                    yield {'result': result, 'hidden_fields': list(hidden_fields)}
 
     @staticmethod
     def get_source_code(contest, problem):
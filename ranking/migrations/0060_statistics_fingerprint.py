@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ranking', '0059_auto_20210703_2308'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statistics',
+            name='fingerprint',
+            field=models.CharField(blank=True, default=None, max_length=32, null=True),
+        ),
+    ]
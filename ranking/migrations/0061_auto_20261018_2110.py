@@ -0,0 +1,25 @@
+# Generated by Django 3.1.12 on 2026-10-18 21:10
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ranking', '0060_statistics_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='max_delay_on_unchanged',
+            field=models.DurationField(default=datetime.timedelta(days=1)),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='min_delay_on_unchanged',
+            field=models.DurationField(default=datetime.timedelta(seconds=300)),
+        ),
+    ]
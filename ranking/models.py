@@ -1,28 +1,114 @@
 import ast
 import collections
+import hashlib
+import json
 import re
+import threading
 from copy import deepcopy
+from datetime import timedelta
 from pydoc import locate
 from urllib.parse import urljoin
 
+import numpy as np
 import tqdm
 from django.db import models, transaction
-from django.db.models import F, Sum
+from django.db.models import Count, F, Max, Q, Sum
 from django.db.models.functions import Coalesce, Upper
 from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django_countries.fields import CountryField
 from django_print_sql import print_sql
-from sql_util.utils import SubqueryCount, SubquerySum
+from sql_util.utils import SubqueryCount, SubqueryMax, SubquerySum
 
 from clist.models import Contest, Resource
-from clist.templatetags.extras import add_prefix_to_problem_short, get_number_from_str, get_problem_short, slug
+from clist.templatetags.extras import (add_prefix_to_problem_short, canonize, get_number_from_str, get_problem_short,
+                                       slug)
 from pyclist.indexes import ExpressionIndex, GistIndexTrgrmOps
-from pyclist.models import BaseModel
+from pyclist.models import BaseManager, BaseModel
 from true_coders.models import Coder, Party
 
 
+class AccountManager(BaseManager):
+
+    def bulk_get_or_create(self, resource, keys, batch_size=1000):
+        """
+        Return dict of accounts by keys and set of created keys.
+        Missing accounts are created with one insert per batch, resource n_accounts is adjusted with one update,
+        in-memory resource is not changed, refresh n_accounts from db if needed.
+        """
+        keys = list(dict.fromkeys(keys))
+        accounts = {}
+        for offset in range(0, len(keys), batch_size):
+            qs = self.filter(resource=resource, key__in=keys[offset:offset + batch_size])
+            accounts.update((account.key, account) for account in qs)
+
+        created = set()
+        missing = [self.model(resource=resource, key=key) for key in keys if key not in accounts]
+        if not missing:
+            return accounts, created
+
+        for account in missing:
+            pre_save.send(sender=self.model, instance=account, raw=False, using=self.db, update_fields=None)
+        inserted = self.bulk_upsert(
+            missing,
+            unique_fields=('resource', 'key'),
+            update_fields=None,
+            returning=('id', 'key'),
+            batch_size=batch_size,
+        )
+        inserted = {key: pk for pk, key, _ in inserted}
+        for account in missing:
+            if account.key in inserted:
+                account.pk = inserted[account.key]
+                account._state.adding = False
+                account._state.db = self.db
+                accounts[account.key] = account
+                created.add(account.key)
+
+        concurrent = [account.key for account in missing if account.key not in inserted]
+        for offset in range(0, len(concurrent), batch_size):
+            qs = self.filter(resource=resource, key__in=concurrent[offset:offset + batch_size])
+            accounts.update((account.key, account) for account in qs)
+
+        if created:
+            deferred_counters.add_resource_accounts(resource.pk, len(created))
+        return accounts, created
+
+    def get_by_iexact_keys(self, resource, keys, batch_size=1000):
+        """
+        Return dict of accounts by keys matched case-insensitively by upper key index,
+        account with most contests is chosen for ambiguous keys.
+        """
+        keys_by_upper = collections.defaultdict(list)
+        for key in keys:
+            keys_by_upper[key.upper()].append(key)
+        uppers = list(keys_by_upper)
+        accounts = {}
+        for offset in range(0, len(uppers), batch_size):
+            qs = self.filter(resource=resource).annotate(upper_key=Upper('key'))
+            qs = qs.filter(upper_key__in=uppers[offset:offset + batch_size])
+            qs = qs.order_by('upper_key', '-n_contests', 'id').distinct('upper_key')
+            for account in qs:
+                for key in keys_by_upper.get(account.upper_key, []):
+                    accounts[key] = account
+        return accounts
+
+    def bulk_save(self, accounts, fields, batch_size=1000):
+        """
+        Save fields of accounts with bulk_update, pre_save signal is sent for each account as save() does.
+        """
+        if not accounts:
+            return
+        now = timezone.now()
+        for account in accounts:
+            pre_save.send(sender=self.model, instance=account, raw=False, using=self.db, update_fields=None)
+            account.modified = now
+        fields = set(fields) | {'rating', 'rating50', 'url', 'modified'}
+        self.bulk_update(accounts, fields, batch_size=batch_size)
+
+
 class Account(BaseModel):
     coders = models.ManyToManyField(Coder, blank=True)
     resource = models.ForeignKey(Resource, on_delete=models.CASCADE)
@@ -39,6 +125,8 @@ class Account(BaseModel):
     updated = models.DateTimeField(auto_now_add=True)
     duplicate = models.ForeignKey('Account', null=True, blank=True, on_delete=models.CASCADE)
 
+    objects = AccountManager()
+
     def __str__(self):
         return '%s on %s' % (str(self.key), str(self.resource_id))
 
@@ -94,6 +182,13 @@ def set_account_rating(sender, instance, *args, **kwargs):
 @receiver(post_save, sender=Account)
 @receiver(post_delete, sender=Account)
 def count_resource_accounts(signal, instance, **kwargs):
+    if deferred_counters.active:
+        if signal is post_delete:
+            deferred_counters.add_resource_accounts(instance.resource_id, -1)
+        elif signal is post_save and kwargs['created']:
+            deferred_counters.add_resource_accounts(instance.resource_id, 1)
+        return
+
     if signal is post_delete:
         instance.resource.n_accounts -= 1
         instance.resource.save()
@@ -220,10 +315,24 @@ class Statistics(BaseModel):
     upsolving = models.FloatField(default=0, blank=True)
     addition = models.JSONField(default=dict, blank=True)
     url = models.TextField(null=True, blank=True)
+    fingerprint = models.CharField(max_length=32, default=None, null=True, blank=True)
+
+    objects = BaseManager()
 
     def __str__(self):
         return f'{self.account_id} on {self.contest_id} = {self.solving} + {self.upsolving}'
 
+    @staticmethod
+    def get_fingerprint(*values):
+        """
+        Md5 of canonized values, None if values are not serializable (e.g. dict with int and str keys).
+        """
+        try:
+            data = json.dumps(values, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.md5(data.encode()).hexdigest()
+
     class Meta:
         verbose_name_plural = 'Statistics'
         unique_together = ('account', 'contest')
@@ -238,6 +347,7 @@ class Statistics(BaseModel):
 @receiver(pre_save, sender=Statistics)
 def statistics_pre_save(sender, instance, *args, **kwargs):
     instance.place_as_int = get_number_from_str(instance.place)
+    instance.fingerprint = None
 
 
 @receiver(post_save, sender=Statistics)
@@ -246,6 +356,11 @@ def count_account_contests(signal, instance, **kwargs):
     if instance.addition.get('_no_update_n_contests'):
         return
 
+    if deferred_counters.active:
+        if signal is post_delete or kwargs['created']:
+            deferred_counters.add_accounts([instance.account_id])
+        return
+
     if signal is post_delete:
         instance.account.n_contests -= 1
         instance.account.save()
@@ -258,6 +373,69 @@ def count_account_contests(signal, instance, **kwargs):
         instance.account.save()
 
 
+class DeferredCounters(threading.local):
+    """
+    Inside `with deferred_counters:` count_account_contests and count_resource_accounts signals only collect
+    affected rows. Account n_contests and last_activity are recalculated and resource n_accounts is shifted
+    by set-based updates on exit of the outer block. On exception inside atomic block collected changes are
+    dropped as writes are expected to be rolled back.
+    """
+
+    batch_size = 1000
+
+    def __init__(self):
+        self.depth = 0
+        self.accounts = set()
+        self.resources = collections.Counter()
+
+    @property
+    def active(self):
+        return self.depth > 0
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.depth -= 1
+        if self.depth:
+            return
+        if exc_type is None or not transaction.get_connection().in_atomic_block:
+            self.flush()
+        self.accounts = set()
+        self.resources = collections.Counter()
+
+    def add_accounts(self, accounts_ids):
+        self.accounts.update(accounts_ids)
+        if not self.active:
+            self.flush()
+
+    def add_resource_accounts(self, resource_id, delta):
+        self.resources[resource_id] += delta
+        if not self.active:
+            self.flush()
+
+    def flush(self):
+        accounts_ids = list(self.accounts)
+        self.accounts = set()
+        filt = Q(addition___no_update_n_contests__isnull=True) | Q(addition___no_update_n_contests=False)
+        last_filt = Q(statistics__addition___no_update_n_contests__isnull=True)
+        for offset in range(0, len(accounts_ids), self.batch_size):
+            Account.objects \
+                .filter(pk__in=accounts_ids[offset:offset + self.batch_size]) \
+                .annotate(count=SubqueryCount('statistics', filter=filt)) \
+                .annotate(last=SubqueryMax('statistics__contest__start_time', filter=last_filt)) \
+                .update(n_contests=F('count'), last_activity=F('last'))
+
+        resources, self.resources = self.resources, collections.Counter()
+        for resource_id, delta in resources.items():
+            if delta:
+                Resource.objects.filter(pk=resource_id).update(n_accounts=F('n_accounts') + delta)
+
+
+deferred_counters = DeferredCounters()
+
+
 class Module(BaseModel):
     resource = models.OneToOneField(Resource, on_delete=models.CASCADE)
     path = models.CharField(max_length=255)
@@ -265,6 +443,8 @@ class Module(BaseModel):
     max_delay_after_end = models.DurationField()
     delay_on_error = models.DurationField()
     delay_on_success = models.DurationField(null=True, blank=True)
+    min_delay_on_unchanged = models.DurationField(default=timedelta(minutes=5))
+    max_delay_on_unchanged = models.DurationField(default=timedelta(days=1))
     multi_account_allowed = models.BooleanField(default=False)
     has_accounts_infos_update = models.BooleanField(default=False)
 
@@ -277,10 +457,126 @@ class Stage(BaseModel):
     filter_params = models.JSONField(default=dict, blank=True)
     score_params = models.JSONField(default=dict, blank=True)
 
+    STATISTICS_FIELDS = ('account_id', 'place_as_int', 'solving', 'addition')
+
     def __str__(self):
         return '%s' % (self.contest)
 
-    def update(self):
+    def update(self, statistics_cache=None):
+        with deferred_counters:
+            self._update(statistics_cache=statistics_cache)
+
+    @staticmethod
+    def apply_n_best_scores(results, n_best):
+        """
+        Add sum of n best scores to rows score, other scored problems get result as status.
+        """
+        rows_scores = [row.pop('scores') for row in results]
+        n_scores = max(map(len, rows_scores), default=0)
+        matrix = np.full((len(results), n_scores), -np.inf)
+        for index, scores in enumerate(rows_scores):
+            matrix[index, :len(scores)] = [score for score, _ in scores]
+
+        # stable descending order keeps contests order for equal scores
+        order = np.argsort(-matrix, axis=1, kind='stable')
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(n_scores)[np.newaxis, :], axis=1)
+        best = ranks < n_best
+
+        for row, scores, row_order, row_best in zip(results, rows_scores, order.tolist(), best.tolist()):
+            # sum in descending order with original values to get the same score as sequential adding
+            for index in row_order[:min(n_best, len(scores))]:
+                row['score'] = row.get('score', 0) + scores[index][0]
+            for (_, problem), is_best in zip(scores, row_best):
+                if not is_best:
+                    problem['status'] = problem.pop('result')
+
+    @staticmethod
+    def sort_and_place(results, order_by):
+        """
+        Return results sorted by order_by fields descending and places within divisions, equal scores share place.
+        """
+        if not results:
+            return [], []
+        try:
+            keys = np.array([[r.get(k.lstrip('-'), 0) for k in order_by] for r in results], dtype=float)
+        except (TypeError, ValueError):
+            keys = None
+
+        if keys is None:
+            results = sorted(
+                results,
+                key=lambda r: tuple(r.get(k.lstrip('-'), 0) * (-1 if k.startswith('-') else 1) for k in order_by),
+                reverse=True,
+            )
+            places = []
+            placing_infos = {}
+            for row in results:
+                placing_info = placing_infos.setdefault(row.get('division', 'none'), {})
+                placing_info['index'] = placing_info.get('index', 0) + 1
+                curr_score = tuple(row.get(k.lstrip('-'), 0) for k in order_by)
+                if curr_score != placing_info.get('last_score'):
+                    placing_info['last_score'] = curr_score
+                    placing_info['place'] = placing_info['index']
+                places.append(placing_info['place'])
+            return results, places
+
+        signs = np.array([-1 if k.startswith('-') else 1 for k in order_by])
+        # lexsort is stable and uses last key as primary, negation gives descending order
+        order = np.lexsort((-keys * signs).T[::-1])
+        results = [results[i] for i in order]
+        keys = keys[order]
+
+        divisions = np.array([r.get('division', 'none') for r in results], dtype=object)
+        places = np.empty(len(results), dtype=int)
+        for division in set(divisions.tolist()):
+            indices = np.flatnonzero(divisions == division)
+            new_score = np.ones(len(indices), dtype=bool)
+            new_score[1:] = (keys[indices[1:]] != keys[indices[:-1]]).any(axis=1)
+            places[indices] = np.maximum.accumulate(np.where(new_score, np.arange(1, len(indices) + 1), 0))
+        return results, places.tolist()
+
+    def get_statistics_fields(self):
+        """
+        Return statistics fields used by update, fields from score params are added to common ones.
+        """
+        concrete_fields = {field.attname for field in Statistics._meta.concrete_fields}
+        fields = list(self.STATISTICS_FIELDS)
+        params_fields = [field['field'] for field in self.score_params.get('fields', [])]
+        params_fields.append(self.score_params.get('status'))
+        for field in params_fields:
+            if field in concrete_fields and field not in fields:
+                fields.append(field)
+        return fields
+
+    def get_contests_statistics(self, statistics, contests, cache):
+        """
+        Return dict of statistics lists by contests and total count.
+        Statistics of contests without new, updated or deleted rows since previous update are taken from cache dict,
+        cache is kept in memory by caller, e.g. for stages updated in one parsing run.
+        """
+        fields = self.get_statistics_fields()
+        StageStatistic = collections.namedtuple('StageStatistic', fields)
+
+        versions = statistics.filter(contest__in=contests).order_by().values('contest_id')
+        versions = versions.annotate(count=Count('id'), last=Max('modified'))
+        versions = {v['contest_id']: (v['count'], v['last']) for v in versions}
+
+        filter_params = canonize([self.score_params.get('filter_statistics'), fields])
+
+        ret = {}
+        for contest in contests:
+            version = versions.get(contest.pk)
+            key = (contest.pk, filter_params)
+            value = cache.get(key)
+            if value is None or value[0] != version:
+                stats = statistics.filter(contest_id=contest.pk).values_list(*fields)
+                value = cache[key] = (version, [StageStatistic(*values) for values in stats])
+            ret[contest.pk] = value[1]
+        total = sum(count for count, _ in versions.values())
+        return ret, total
+
+    def _update(self, statistics_cache=None):
         stage = self.contest
 
         contests = Contest.objects.filter(
@@ -368,9 +664,7 @@ class Stage(BaseModel):
                     d['contest'] = r['contest__title']
                 exclude_advances[r['account__key']] = d
 
-        statistics = Statistics.objects \
-            .select_related('account', 'account__duplicate') \
-            .prefetch_related('account__coders')
+        statistics = Statistics.objects.all()
         filter_statistics = self.score_params.get('filter_statistics')
         if filter_statistics:
             statistics = statistics.filter(**filter_statistics)
@@ -379,7 +673,10 @@ class Stage(BaseModel):
             return placing['division'][stat.addition['division']] if 'division' in placing else placing
 
         account_keys = dict()
-        total = statistics.filter(contest__in=contests).count()
+        statistics_cache = {} if statistics_cache is None else statistics_cache
+        contests_statistics, total = self.get_contests_statistics(statistics, contests, statistics_cache)
+        accounts_ids = {s.account_id for stats in contests_statistics.values() for s in stats}
+        accounts = Account.objects.select_related('duplicate').prefetch_related('coders').in_bulk(accounts_ids)
         with tqdm.tqdm(total=total, desc=f'getting statistics for stage {stage}') as pbar, print_sql(count_only=True):
             for idx, contest in enumerate(contests, start=1):
                 skip_problem_stat = '_skip_for_problem_stat' in contest.info.get('fields', [])
@@ -389,7 +686,7 @@ class Stage(BaseModel):
                     problem_info_key = str(contest.pk)
                     problem_short = get_problem_short(problems_infos[problem_info_key])
                 pbar.set_postfix(contest=contest)
-                stats = statistics.filter(contest_id=contest.pk)
+                stats = contests_statistics[contest.pk]
 
                 if placing:
                     placing_scores = deepcopy(placing)
@@ -439,7 +736,7 @@ class Stage(BaseModel):
                             problems_infos[problem_info_key].setdefault('n_accepted', 0)
                             problems_infos[problem_info_key]['n_accepted'] += 1
 
-                    account = s.account
+                    account = accounts[s.account_id]
                     if account.duplicate is not None:
                         account = account.duplicate
 
@@ -522,8 +819,15 @@ class Stage(BaseModel):
 
                     pbar.update()
 
-        for writer in contest.writers.all():
-            account_keys[writer.key] = writer
+        for contest in contests:
+            for writer in contest.writers.all():
+                account_keys[writer.key] = writer
+        missing_writers = {
+            writer
+            for contest in contests if not detail_problems
+            for writer in contest.info.get('writers', []) if writer not in account_keys
+        }
+        account_keys.update(Account.objects.get_by_iexact_keys(self.contest.resource, missing_writers))
         total = sum([len(contest.info.get('writers', [])) for contest in contests])
         with tqdm.tqdm(total=total, desc=f'getting writers for stage {stage}') as pbar, print_sql(count_only=True):
             writers = set()
@@ -534,14 +838,7 @@ class Stage(BaseModel):
                 problem_info_key = str(contest.pk)
                 problem_short = get_problem_short(problems_infos[problem_info_key])
                 for writer in contest_writers:
-                    if writer in account_keys:
-                        account = account_keys[writer]
-                    else:
-                        try:
-                            account = Account.objects.get(resource_id=contest.resource_id, key__iexact=writer)
-                        except Account.DoesNotExist:
-                            account = None
-
+                    account = account_keys.get(writer)
                     pbar.update()
                     if not account:
                         continue
@@ -562,11 +859,14 @@ class Stage(BaseModel):
 
         if self.score_params.get('writers_proportionally_score'):
             n_contests = len(contests)
-            for account in writers:
-                row = results[account]
-                if n_contests == row['writer'] or 'score' not in row:
-                    continue
-                row['score'] = row['score'] / (n_contests - row['writer']) * n_contests
+            rows = [results[account] for account in writers]
+            rows = [row for row in rows if n_contests != row['writer'] and 'score' in row]
+            if rows:
+                scores = np.array([row['score'] for row in rows], dtype=float)
+                n_writers = np.array([row['writer'] for row in rows], dtype=float)
+                scores = scores / (n_contests - n_writers) * n_contests
+                for row, score in zip(rows, scores.tolist()):
+                    row['score'] = score
 
         for field in fields:
             t = field.get('type')
@@ -594,13 +894,7 @@ class Stage(BaseModel):
 
         results = list(results.values())
         if n_best:
-            for row in results:
-                scores = row.pop('scores')
-                for index, (score, problem) in enumerate(sorted(scores, key=lambda s: s[0], reverse=True)):
-                    if index < n_best:
-                        row['score'] = row.get('score', 0) + score
-                    else:
-                        problem['status'] = problem.pop('result')
+            self.apply_n_best_scores(results, n_best)
 
         filtered_results = []
         for r in results:
@@ -625,30 +919,26 @@ class Stage(BaseModel):
                     problems_infos[problem_info_key]['n_teams'] -= 1
         results = filtered_results
 
-        results = sorted(
-            results,
-            key=lambda r: tuple(r.get(k.lstrip('-'), 0) * (-1 if k.startswith('-') else 1) for k in order_by),
-            reverse=True,
-        )
+        results, places = self.sort_and_place(results, order_by)
 
         with transaction.atomic():
             fields_set = set()
             fields = list()
 
             pks = set()
-            placing_infos = {}
+            upsert_statistics = []
+            old_stats = {
+                account_id: (pk, canonize(values))
+                for pk, account_id, *values in stage.statistics_set.values_list(
+                    'pk', 'account_id', 'place', 'solving', 'addition',
+                )
+            }
             score_advance = None
             place_advance = 0
-            for row in tqdm.tqdm(results, desc=f'update statistics for stage {stage}'):
+            for row, place in zip(tqdm.tqdm(results, desc=f'update statistics for stage {stage}'), places):
                 row['_no_update_n_contests'] = True
                 division = row.get('division', 'none')
-                placing_info = placing_infos.setdefault(division, {})
-                placing_info['index'] = placing_info.get('index', 0) + 1
-
                 curr_score = tuple(row.get(k.lstrip('-'), 0) for k in order_by)
-                if curr_score != placing_info.get('last_score'):
-                    placing_info['last_score'] = curr_score
-                    placing_info['place'] = placing_info['index']
 
                 if advances and ('divisions' not in advances or division in advances['divisions']):
                     tmp = score_advance, place_advance
@@ -676,22 +966,31 @@ class Stage(BaseModel):
                         score_advance, place_advance = tmp
                 account = row.pop('member')
                 solving = row.pop('score')
-                stat, created = Statistics.objects.update_or_create(
-                    account=account,
-                    contest=stage,
-                    defaults={
-                        'place': str(placing_info['place']),
-                        'place_as_int': placing_info['place'],
-                        'solving': solving,
-                        'addition': row,
-                    },
-                )
-                pks.add(stat.pk)
+                pk, old_values = old_stats.get(account.pk, (None, None))
+                values = canonize([str(place), float(solving), row])
+                if values == old_values:
+                    pks.add(pk)
+                else:
+                    upsert_statistics.append(Statistics(
+                        account=account,
+                        contest=stage,
+                        place=str(place),
+                        place_as_int=place,
+                        solving=solving,
+                        addition=row,
+                    ))
 
                 for k in row.keys():
                     if k not in fields_set:
                         fields_set.add(k)
                         fields.append(k)
+
+            upserted = Statistics.objects.bulk_upsert(
+                upsert_statistics,
+                unique_fields=('account', 'contest'),
+                update_fields=('place', 'place_as_int', 'solving', 'addition', 'fingerprint'),
+            )
+            pks.update(pk for pk, _ in upserted)
             stage.statistics_set.exclude(pk__in=pks).delete()
             stage.n_statistics = len(results)
 
@@ -11,6 +11,7 @@ import mimetypes
 import random
 import re
 import string
+import threading
 import traceback
 import urllib.error
 import urllib.parse
@@ -22,8 +23,7 @@ from hashlib import md5
 from http.cookiejar import Cookie, MozillaCookieJar
 from io import BytesIO
 from json import dumps, load, loads
-from os import environ, listdir, makedirs, path, remove, stat
-from os.path import getctime, isdir
+from os import environ, makedirs, path
 from random import choice, gauss
 from string import ascii_letters, digits
 from sys import stderr
@@ -32,6 +32,10 @@ from time import sleep
 import chardet
 from fp.fp import FreeProxy
 
+from .cache import FileCache
+from .limiter import RateLimiter
+from .pool import ConnectionPool, KeepAliveHTTPHandler, KeepAliveHTTPSHandler
+
 logging.getLogger('chardet.charsetprober').setLevel(logging.INFO)
 
 
@@ -314,6 +318,26 @@ def encode_multipart(fields=None, files=None, boundary=None):
     return body, headers
 
 
+class local_property:
+    """
+    Attribute of requester stored per thread.
+    """
+
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance._local, self.name, self.default)
+
+    def __set__(self, instance, value):
+        setattr(instance._local, self.name, value)
+
+
 class requester():
     cache_timeout = 10940
     caching = True
@@ -323,14 +347,27 @@ class requester():
     dir_cache = path.dirname(path.abspath(__file__)) + "/cache/"
     cookie_filename = path.join(path.dirname(path.abspath(__file__)), ".cookie")
     default_filepath_proxies = path.join(path.dirname(__file__), "proxies.txt")
-    last_page = None
-    last_url = None
-    ref_url = None
+    last_page = local_property()
+    last_url = local_property()
+    ref_url = local_property()
+    response = local_property()
+    error = local_property()
+    time_response = local_property()
+    opener_headers = local_property()
     time_sleep = 1e-1
     limit_file_cache = 200
-    counter_file_cache = 0
+    counter_requests = 0
+    counter_cache_hits = 0
+    counter_lock = threading.Lock()
+    rate_limiter = RateLimiter()
+    file_caches = {}
     verify_word = None
 
+    @classmethod
+    def increment_counter(cls, name):
+        with cls.counter_lock:
+            setattr(cls, name, getattr(cls, name) + 1)
+
     def print(self, *objs, force=False):
         if self.debug_output or force:
             print(datetime.utcnow(), *objs, file=stderr)
@@ -342,6 +379,7 @@ class requester():
                  user_agent=None,
                  headers=None,
                  file_name_with_proxies=default_filepath_proxies):
+        self._local = threading.local()
         if cookie_filename:
             self.cookie_filename = cookie_filename
         if caching is not None:
@@ -373,9 +411,17 @@ class requester():
                 self.cookiejar.load()
         else:
             self.cookiejar = MozillaCookieJar()
+        self.cookie_lock = self.cookiejar._cookies_lock
 
         self.http_cookie_processor = urllib.request.HTTPCookieProcessor(self.cookiejar)
-        self.opener = urllib.request.build_opener(self.http_cookie_processor)
+        self.connection_pool = ConnectionPool()
+        self.opener = urllib.request.build_opener(
+            self.http_cookie_processor,
+            KeepAliveHTTPHandler(self.connection_pool),
+            KeepAliveHTTPSHandler(self.connection_pool),
+        )
+        # headers are set per request from opener_headers of current thread
+        self.opener.addheaders = []
         self.proxer = None
 
     def set_proxy(self, proxy, filepath_proxies=default_filepath_proxies, **kwargs):
@@ -409,6 +455,7 @@ class requester():
         files=None,
         return_url=False,
         return_last_url=False,
+        rate_limit_key=None,
     ):
         prefix = "local-file:"
         if url.startswith(prefix):
@@ -424,8 +471,6 @@ class requester():
         url = url.replace('&amp;', '&')
         url = url.replace(' ', '%20')
 
-        makedirs(self.dir_cache, mode=0o777, exist_ok=True)
-
         files = files or isinstance(post, dict) and post.pop('files__', None)
 
         if post and isinstance(post, dict):
@@ -435,48 +480,38 @@ class requester():
         else:
             post_urlencoded = post
 
-        try:
-            file_cache = ''.join((
-                self.dir_cache,
-                md5((md5_file_cache or url + (post_urlencoded or "")).encode()).hexdigest(),
-                ("/" + url[url.find("//") + 2:].split("?", 2)[0]).replace("/", "_"),
-                ".html",
-            ))
-        except Exception:
-            file_cache = None
-
+        file_cache = self.get_file_cache(url, post_urlencoded, md5_file_cache)
         caching = file_cache and caching and self.cache_timeout > 0
+        page = self.read_file_cache(file_cache) if caching else None
+        from_cache = page is not None
 
-        from_cache = caching
-        if caching:
-            if not path.isfile(file_cache):
-                from_cache = False
-            else:
-                diff_time = datetime.now() - datetime.fromtimestamp(path.getctime(file_cache))
-                from_cache = diff_time.seconds < self.cache_timeout
         self.print(("[cache] " if from_cache else "") + url, force=from_cache)
         self.error = None
         response = None
         last_url = None
         if from_cache:
-            with open(file_cache, "r") as f:
-                page = f.read()
+            requester.increment_counter('counter_cache_hits')
         else:
+            requester.increment_counter('counter_requests')
             if self.proxer and not self.proxer.is_alive():
                 raise ProxyLimitReached()
-            if self.time_sleep:
+            delay = self.rate_limiter.acquire(url, key=rate_limit_key)
+            if delay is None and self.time_sleep:
                 v_time_sleep = min(1, abs(gauss(0, 1)) * self.time_sleep)
                 sleep(v_time_sleep)
             if not headers:
                 headers = {}
             if self.ref_url and 'Referer' not in headers:
                 headers.update({"Referer": self.ref_url})
-            if not self.last_url or urllib.parse.urlparse(self.last_url).netloc != urllib.parse.urlparse(url).netloc:
-                self.opener.addheaders = self._init_opener_headers
+            if (
+                not self.last_url or self.opener_headers is None
+                or urllib.parse.urlparse(self.last_url).netloc != urllib.parse.urlparse(url).netloc
+            ):
+                self.opener_headers = self._init_opener_headers
             if headers:
-                h = dict(self.opener.addheaders)
+                h = dict(self.opener_headers)
                 h.update(headers)
-                self.opener.addheaders = list(h.items())
+                self.opener_headers = list(h.items())
 
             if content_type == 'multipart/form-data' and post or files:
                 post_urlencoded, multipart_headers = encode_multipart(fields=post, files=files)
@@ -485,10 +520,7 @@ class requester():
                 headers.update({"Content-type": content_type})
 
             try:
-                if headers:
-                    request = urllib.request.Request(url, headers=headers)
-                else:
-                    request = url
+                request = self.make_request(url, headers)
 
                 time_start = datetime.utcnow()
 
@@ -502,6 +534,7 @@ class requester():
                 )
                 last_url = response.geturl() if response else url
                 if return_last_url:
+                    response.close()
                     return last_url
                 if response.info().get("Content-Encoding", None) == "gzip":
                     buf = BytesIO(response.read())
@@ -524,21 +557,8 @@ class requester():
 
             response_content_type = response.info().get('Content-Type')
 
-            try:
-                if file_cache and caching:
-                    cookie_write = True
-                    if response_content_type.startswith('application/json'):
-                        page = dumps(loads(page), indent=4)
-                        cookie_write = False
-                    if response_content_type.startswith('image/'):
-                        cookie_write = False
-                    with open(file_cache, "w") as f:
-                        f.write(page.decode('utf8'))
-                        if cookie_write:
-                            f.write("\n\n" + dumps(self.get_cookies(), indent=4))
-            except Exception:
-                traceback.print_exc()
-                self.print("[cache] ERROR: write to", file_cache)
+            if file_cache and caching:
+                self.write_file_cache(file_cache, page, response_content_type)
 
             if self.proxer:
                 if not self.error:
@@ -577,20 +597,75 @@ class requester():
         self.last_page = page
         if is_ref_url:
             self.ref_url = self.last_url
-        self.file_cache_clear()
         self.response = response
         self.last_url = last_url
         return (page, last_url) if return_url else page
 
+    @property
+    def file_cache(self):
+        with self.counter_lock:
+            cache = requester.file_caches.get(self.dir_cache)
+            if cache is None:
+                cache = requester.file_caches[self.dir_cache] = FileCache(self.dir_cache, limit=self.limit_file_cache)
+        return cache
+
+    def get_file_cache(self, url, post_urlencoded=None, md5_file_cache=None):
+        try:
+            return md5((md5_file_cache or url + (post_urlencoded or "")).encode()).hexdigest()
+        except Exception:
+            return None
+
+    def read_file_cache(self, file_cache):
+        return self.file_cache.get(file_cache)
+
+    def write_file_cache(self, file_cache, page, content_type):
+        try:
+            content_type = content_type or ''
+            if isinstance(page, bytes):
+                page = page.decode('utf8')
+            cookie_write = True
+            if content_type.startswith('application/json'):
+                page = dumps(loads(page), indent=4)
+                cookie_write = False
+            if content_type.startswith('image/'):
+                cookie_write = False
+            if cookie_write:
+                page += "\n\n" + dumps(self.get_cookies(), indent=4)
+            self.file_cache.set(file_cache, page, timeout=self.cache_timeout)
+        except Exception:
+            traceback.print_exc()
+            self.print("[cache] ERROR: write to", file_cache)
+
     @property
     def current_url(self):
         return self.last_url
 
+    def fetch_many(self, urls, **kwargs):
+        """
+        Iterate FetchResult of urls fetched concurrently by asyncio in order of completion.
+        """
+        from .aio import iterate_fetch_many
+        return iterate_fetch_many(self, urls, **kwargs)
+
+    def async_fetch_many(self, urls, **kwargs):
+        from .aio import fetch_many
+        return fetch_many(self, urls, **kwargs)
+
+    def make_request(self, url, headers=None):
+        request_headers = dict(self.opener_headers or self._init_opener_headers)
+        if headers:
+            request_headers.update(headers)
+        return urllib.request.Request(url, headers=request_headers)
+
     def head(self, url):
-        return self.opener.open(url).getheaders()
+        self.rate_limiter.acquire(url)
+        with self.opener.open(self.make_request(url)) as response:
+            return response.getheaders()
 
     def geturl(self, url):
-        return self.opener.open(url).geturl()
+        self.rate_limiter.acquire(url)
+        with self.opener.open(self.make_request(url)) as response:
+            return response.geturl()
 
     def get_link_by_text(self, text, page=None):
         if page is None:
@@ -688,25 +763,15 @@ class requester():
         }[form['method'].lower()]()
         return ret
 
-    def file_cache_clear(self):
-        if self.limit_file_cache and self.counter_file_cache % self.limit_file_cache == 0:
-            file_list = []
-            for file_cache in listdir(self.dir_cache):
-                stat_file = stat(self.dir_cache + file_cache)
-                file_list.append((stat_file.st_atime, file_cache))
-            file_list.sort(reverse=True)
-            for atime, file_cache in file_list[self.limit_file_cache:]:
-                remove(self.dir_cache + file_cache)
-        self.counter_file_cache += 1
-
     def get_raw_cookies(self):
-        for c in self.cookiejar:
-            yield c
+        with self.cookie_lock:
+            cookies = list(self.cookiejar)
+        yield from cookies
 
     def get_cookies(self, domain_regex=None):
         return dict((
             (i.name, i.value)
-            for i in self.cookiejar
+            for i in self.get_raw_cookies()
             if domain_regex is None or re.search(domain_regex, i.domain)
         ))
 
@@ -714,7 +779,7 @@ class requester():
         return self.get_cookies(*args, **kwargs).get(name, None)
 
     def set_cookie(self, name, value):
-        for c in self.cookiejar:
+        for c in self.get_raw_cookies():
             if c.name == name:
                 c.value = value
                 self.cookiejar.set_cookie(c)
@@ -756,16 +821,20 @@ class requester():
 
     def save_cookie(self):
         if self.cookie_filename and hasattr(self, 'cookiejar'):
-            self.cookiejar.save(self.cookie_filename)
+            with self.cookie_lock:
+                self.cookiejar.save(self.cookie_filename)
 
     def close(self):
         if self.proxer:
             self.proxer.save_data()
         self.save_cookie()
+        self.connection_pool.close()
 
     def __call__(self, with_proxy=False, args_proxy=None):
         if with_proxy:
             ret = copy.copy(self)
+            ret._local = threading.local()
+            ret._local.__dict__.update(self._local.__dict__)
             ret.init_opener()
             args_proxy = args_proxy or {}
             ret.set_proxy(proxy=True, **args_proxy)
@@ -781,13 +850,9 @@ class requester():
     def cleanup(self):
         self.save_cookie()
 
-        if not isdir(self.dir_cache):
-            return
-
-        for file_cache in listdir(self.dir_cache):
-            diff_time = (datetime.now() - datetime.fromtimestamp(getctime(self.dir_cache + file_cache)))
-            if diff_time.seconds >= self.cache_timeout:
-                remove(self.dir_cache + file_cache)
+        cache = requester.file_caches.get(self.dir_cache)
+        if cache is not None:
+            cache.cleanup()
 
 
 if __name__ == "__main__":
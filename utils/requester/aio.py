@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import email.message
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from io import BytesIO
+from os import makedirs
+
+import aiohttp
+
+from . import FailOnGetResponse
+
+FetchResult = namedtuple('FetchResult', ['url', 'page', 'error'])
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CookieResponse:
+    """
+    Adapter of aiohttp response headers for http.cookiejar extract_cookies.
+    """
+
+    def __init__(self, headers):
+        self.message = email.message.Message()
+        for value in headers.getall('Set-Cookie', ()):
+            self.message['Set-Cookie'] = value
+
+    def info(self):
+        return self.message
+
+
+def decode_page(body, content_type, charset):
+    if content_type.startswith('image/'):
+        return body
+    try:
+        return body.decode(charset or 'utf-8', 'replace')
+    except LookupError:
+        return body.decode('utf-8', 'replace')
+
+
+async def fetch_url(req, session, url, headers, timeout, attempts, caching, rate_limit_key):
+    # file cache is read and written in executor to not block event loop
+    loop = asyncio.get_event_loop()
+    file_cache = req.get_file_cache(url) if caching else None
+    if file_cache:
+        page = await loop.run_in_executor(None, req.read_file_cache, file_cache)
+        if page is not None:
+            req.print('[cache] ' + url, force=True)
+            req.increment_counter('counter_cache_hits')
+            return FetchResult(url, page, None)
+
+    error = None
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(2 ** (attempt - 1))
+        await req.rate_limiter.async_acquire(url, key=rate_limit_key)
+        request = urllib.request.Request(url)
+        req.cookiejar.add_cookie_header(request)
+        request_headers = dict(headers)
+        if request.has_header('Cookie'):
+            request_headers['Cookie'] = request.get_header('Cookie')
+
+        req.print(url)
+        req.increment_counter('counter_requests')
+        try:
+            async with session.get(url, headers=request_headers, timeout=timeout) as response:
+                req.cookiejar.extract_cookies(CookieResponse(response.headers), request)
+                body = await response.read()
+                if response.status >= 400:
+                    error = urllib.error.HTTPError(url, response.status, response.reason, response.headers,
+                                                   BytesIO(body))
+                    if response.status in RETRY_STATUSES:
+                        continue
+                    break
+                content_type = response.headers.get('Content-Type', '')
+                page = decode_page(body, content_type, response.charset)
+                if file_cache:
+                    await loop.run_in_executor(None, req.write_file_cache, file_cache, page, content_type)
+                return FetchResult(url, page, None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            error = err
+    req.print('[error]', str(error)[:80])
+    return FetchResult(url, None, FailOnGetResponse(error))
+
+
+async def fetch_many(
+    req,
+    urls,
+    limit=100,
+    limit_per_host=8,
+    time_out=None,
+    attempts=3,
+    caching=None,
+    headers=None,
+    rate_limit_key=None,
+):
+    """
+    Fetch urls concurrently and yield FetchResult as they complete.
+    Cookies, file cache and rate limiter are shared with requester, connections are limited in total and per host.
+    """
+    if caching is None:
+        caching = req.caching
+    caching = caching and req.cache_timeout > 0
+    if caching:
+        makedirs(req.dir_cache, mode=0o777, exist_ok=True)
+
+    request_headers = dict(req._init_opener_headers)
+    request_headers.update(headers or {})
+    time_out = time_out or req.time_out
+    timeout = aiohttp.ClientTimeout(sock_connect=time_out, sock_read=time_out)
+
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
+        tasks = [
+            asyncio.ensure_future(
+                fetch_url(req, session, url, request_headers, timeout, attempts, caching, rate_limit_key)
+            )
+            for url in urls
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iterate_fetch_many(req, urls, **kwargs):
+    loop = asyncio.new_event_loop()
+    results = fetch_many(req, urls, **kwargs)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from os import getpid, makedirs, path, remove, replace, scandir
+from time import time
+
+
+class FileCache:
+    """
+    Pages are stored in files sharded by key prefix, sqlite index keeps size, access and expire times of entries.
+    Lookup is one indexed query, overflow over limit is evicted by least recent access on write.
+    """
+
+    INDEX_FILENAME = 'index.sqlite3'
+    CLEANUP_BATCH_SIZE = 1000
+    FLAT_FILE_REGEX = re.compile('^[0-9a-f]{32}.*[.]html$')
+
+    def __init__(self, directory, limit=None):
+        self.directory = directory
+        self.limit = limit
+        self.local = threading.local()
+        makedirs(directory, mode=0o777, exist_ok=True)
+        with self.transaction() as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    atime REAL NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)')
+            cursor.execute('CREATE TABLE IF NOT EXISTS counter (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER)')
+            cursor.execute('INSERT OR IGNORE INTO counter (id, n) VALUES (0, 0)')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+                BEGIN UPDATE counter SET n = n + 1 WHERE id = 0; END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+                BEGIN UPDATE counter SET n = n - 1 WHERE id = 0; END
+            ''')
+            cursor.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('flat_files_removed', '1')")
+            remove_flat_files = cursor.rowcount > 0
+        if remove_flat_files:
+            self.remove_flat_files()
+
+    def remove_flat_files(self):
+        """
+        Remove files of previous flat layout with <md5>_<url path>.html files in cache directory, done once.
+        """
+        with scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and self.FLAT_FILE_REGEX.match(entry.name):
+                    try:
+                        remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        # sqlite connection must not be shared with forked process
+        if connection is None or self.local.pid != getpid():
+            connection = sqlite3.connect(
+                path.join(self.directory, self.INDEX_FILENAME),
+                timeout=60,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        else:
+            cursor.execute('COMMIT')
+        finally:
+            cursor.close()
+
+    def get_path(self, key):
+        return path.join(self.directory, key[:2], key[2:4], key)
+
+    def get(self, key):
+        now = time()
+        row = self.connection.execute('SELECT expires FROM entries WHERE key = ?', (key, )).fetchone()
+        if row is None:
+            return None
+        if row[0] <= now:
+            self.delete([key])
+            return None
+        try:
+            with open(self.get_path(key), 'r') as fo:
+                content = fo.read()
+        except FileNotFoundError:
+            self.delete([key])
+            return None
+        with self.transaction() as cursor:
+            cursor.execute('UPDATE entries SET atime = ? WHERE key = ?', (now, key))
+        return content
+
+    def set(self, key, content, timeout):
+        filepath = self.get_path(key)
+        makedirs(path.dirname(filepath), mode=0o777, exist_ok=True)
+        tmp_filepath = f'{filepath}.{getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_filepath, 'w') as fo:
+            fo.write(content)
+        replace(tmp_filepath, filepath)
+
+        now = time()
+        evicted = []
+        with self.transaction() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO entries (key, size, atime, expires) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET size = excluded.size, atime = excluded.atime, expires = excluded.expires
+                ''',
+                (key, len(content), now, now + timeout),
+            )
+            if self.limit:
+                n_entries = cursor.execute('SELECT n FROM counter WHERE id = 0').fetchone()[0]
+                if n_entries > self.limit:
+                    cursor.execute('SELECT key FROM entries ORDER BY atime LIMIT ?', (n_entries - self.limit, ))
+                    evicted = [k for k, in cursor.fetchall()]
+                    cursor.executemany('DELETE FROM entries WHERE key = ?', [(k, ) for k in evicted])
+        self.remove_files(evicted)
+
+    def delete(self, keys):
+        with self.transaction() as cursor:
+            cursor.executemany('DELETE FROM entries WHERE key = ?', [(k, ) for k in keys])
+        self.remove_files(keys)
+
+    def remove_files(self, keys):
+        for key in keys:
+            try:
+                remove(self.get_path(key))
+            except FileNotFoundError:
+                pass
+
+    def cleanup(self):
+        now = time()
+        while True:
+            query = 'SELECT key FROM entries WHERE expires <= ? ORDER BY expires LIMIT ?'
+            keys = [k for k, in self.connection.execute(query, (now, self.CLEANUP_BATCH_SIZE))]
+            if not keys:
+                break
+            self.delete(keys)
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
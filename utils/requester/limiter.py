@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import urllib.parse
+from time import monotonic, sleep
+
+
+class TokenBucket:
+    """
+    Bucket refilled by rate tokens per second up to burst, negative tokens are reserved by waiting callers.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or 1
+        self.tokens = self.burst
+        self.timestamp = monotonic()
+
+    def reserve(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class RateLimiter:
+    """
+    Token buckets by host or by custom key (e.g. api key). Host limit is applied to its subdomains too.
+    Requests to hosts without limit are not counted.
+    """
+
+    def __init__(self):
+        self.limits = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, key, rate, burst=None):
+        with self.lock:
+            if self.limits.get(key) == (rate, burst):
+                return
+            self.limits[key] = (rate, burst)
+            self.buckets.pop(key, None)
+
+    def configure_hosts(self, rate_limits):
+        for host, limit in rate_limits.items():
+            self.configure(host, limit['rate'], limit.get('burst'))
+
+    def get_key(self, url):
+        host = urllib.parse.urlparse(url).hostname or ''
+        while host:
+            if host in self.limits:
+                return host
+            _, _, host = host.partition('.')
+
+    def reserve(self, url=None, key=None):
+        """
+        Return seconds to wait before request or None if request is not limited.
+        """
+        with self.lock:
+            if key is None or key not in self.limits:
+                key = self.get_key(url) if url else None
+            if key is None:
+                return None
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(*self.limits[key])
+            return bucket.reserve()
+
+    def acquire(self, url=None, key=None):
+        delay = self.reserve(url, key)
+        if delay:
+            sleep(delay)
+        return delay
+
+    async def async_acquire(self, url=None, key=None):
+        delay = self.reserve(url, key)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
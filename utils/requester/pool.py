@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import http.client
+import socket
+import threading
+import urllib.request
+from collections import defaultdict, deque
+from io import BytesIO
+from urllib.error import URLError
+
+
+class KeepAliveResponse(http.client.HTTPResponse):
+    """
+    Response gives back connection to pool after body is fully read.
+    Connection is closed if response is closed with unread body.
+    """
+
+    on_release = None
+
+    def _close_conn(self):
+        super()._close_conn()
+        self._release(reusable=not self.will_close)
+
+    def close(self):
+        self._release(reusable=self.length == 0 and not self.will_close)
+        super().close()
+
+    def _release(self, reusable):
+        on_release, self.on_release = self.on_release, None
+        if on_release is not None:
+            on_release(reusable)
+
+    def preload(self):
+        """
+        Read body to give back connection, body is still available for read.
+        """
+        body = self.read()
+        self.fp = BytesIO(body)
+        self.length = len(body)
+        self.chunked = False
+
+
+class ConnectionPool:
+    """
+    Idle persistent connections by (connection class, host, tunnel host).
+    """
+
+    def __init__(self, max_per_host=10):
+        self.max_per_host = max_per_host
+        self.idle = defaultdict(deque)
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop()
+
+    def release(self, key, connection):
+        with self.lock:
+            idle = self.idle[key]
+            if len(idle) < self.max_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, defaultdict(deque)
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class KeepAliveHandlerMixin:
+    """
+    HTTP/1.1 keep-alive replacement of AbstractHTTPHandler.do_open.
+    Stale reused connection is reconnected once, proxy and tunnel requests are pooled by proxy and target hosts.
+    """
+
+    def __init__(self, pool, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+
+    @staticmethod
+    def _request(connection, req, headers):
+        connection.request(req.get_method(), req.selector, req.data, headers,
+                           encode_chunked=req.has_header('Transfer-encoding'))
+        return connection.getresponse()
+
+    def do_open(self, http_class, req, **http_conn_args):
+        host = req.host
+        if not host:
+            raise URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers['Connection'] = 'keep-alive'
+        headers = {name.title(): val for name, val in headers.items()}
+
+        tunnel_headers = {}
+        if req._tunnel_host:
+            proxy_auth_hdr = 'Proxy-Authorization'
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers.pop(proxy_auth_hdr)
+
+        key = (http_class, host, req._tunnel_host)
+        response = None
+        connection = self.pool.acquire(key)
+        if connection is not None:
+            connection.timeout = req.timeout
+            if connection.sock is not None:
+                timeout = req.timeout
+                if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                    timeout = socket.getdefaulttimeout()
+                connection.sock.settimeout(timeout)
+            try:
+                response = self._request(connection, req, headers)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+
+        if response is None:
+            connection = http_class(host, timeout=req.timeout, **http_conn_args)
+            connection.set_debuglevel(self._debuglevel)
+            connection.response_class = KeepAliveResponse
+            if req._tunnel_host:
+                connection.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+            try:
+                try:
+                    response = self._request(connection, req, headers)
+                except OSError as err:
+                    raise URLError(err)
+            except BaseException:
+                connection.close()
+                raise
+
+        def on_release(reusable):
+            if reusable and connection.sock is not None:
+                self.pool.release(key, connection)
+            else:
+                connection.close()
+
+        if response.will_close:
+            on_release(False)
+        else:
+            response.on_release = on_release
+
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+    def http_response(self, req, response):
+        # error response is passed to HTTPError which is not always read or closed by caller
+        if not 200 <= response.status < 300 and isinstance(response, KeepAliveResponse):
+            response.preload()
+        return response
+
+    https_response = http_response
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, urllib.request.HTTPHandler):
+    pass
+
+
+class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, urllib.request.HTTPSHandler):
+    pass